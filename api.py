@@ -1,16 +1,39 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 import logging
-from fastapi.responses import FileResponse, PlainTextResponse
-from pydantic import BaseModel
-from src import run_workflow, graph  # Import from src package
-from langchain_core.runnables.graph import MermaidDrawMethod
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from contextlib import asynccontextmanager
+from src import arun_workflow, astream_workflow, pipelines, result_cache, inflight
+from src.graph import checkpoints, llm1, llm2, run_status
+from src.llm import cache_stats as llm_cache_stats  # Import from src package
+from src.edits import edit_review_stats
+from src.structured import structured_stats
+from src.web_search import web_search_stats
+from src.ratelimit import rate_limiter
+from src.routing import routing_stats
+from src.jobs import QueueFull, job_queue_from_env
+from src.batch import BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY, run_batch
+from src.metrics import render as render_metrics
+from src.diagram import diagrams, png_available
+import asyncio
 import traceback 
 import time
-import os
+import json
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The job store is opened here rather than at import, so importing the app writes no files
+    global jobs
+    jobs = job_queue_from_env(run_job)
+    jobs.start()
+    yield
+    await jobs.stop()
+    jobs = None
+    await checkpoints.close()
 
-from typing import Union
+app = FastAPI(lifespan=lifespan)
+
+from typing import Literal, Union
 
 class Metadata(BaseModel):
     title: str | None = None
@@ -22,16 +45,23 @@ class Metadata(BaseModel):
 class SourceRequest(BaseModel):
     source: Union[str, dict]
     metadata: Metadata | None = None
+    run_id: str | None = None
+    variant: Literal["fast", "standard", "full"] = "standard"
 
     def get_source(self) -> str:
         if isinstance(self.source, dict):
             return str(self.source)
         return self.source
 
+class JobRequest(SourceRequest):
+    lane: Literal["high", "normal", "low"] = "normal"
+    cache: bool = True
+
 logger = logging.getLogger("uvicorn")
 
 @app.post("/process")
-def process_source(request: SourceRequest, plain: bool = False):
+async def process_source(request: SourceRequest, plain: bool = False, cache: bool = True, timings: bool = False,
+                         deadline_ms: int | None = Query(None, gt=0)):
     logger.info("Processing new request")
     if request.metadata:
         logger.info(f"Metadata: {request.metadata}")
@@ -39,63 +69,200 @@ def process_source(request: SourceRequest, plain: bool = False):
     try:
         start_time = time.time()
         # Pass both source and metadata to run_workflow
-        result = run_workflow(
+        result = await arun_workflow(
             input_message=request.get_source(),
-            metadata=request.metadata.dict() if request.metadata else None
+            metadata=request.metadata.dict() if request.metadata else None,
+            variant=request.variant,
+            use_cache=cache,
+            run_id=request.run_id,
+            deadline_ms=deadline_ms
         )
         end_time = time.time()
         elapsed_time = round(end_time - start_time, 2)
         logger.info(f"/process completed for {result['outline']['title']} in {elapsed_time} seconds")
         if plain:
             return PlainTextResponse(result["final_article"])
-            
-        return {
-            "elapsed_time": elapsed_time,
-            "title": result["outline"]["title"],
-            "full_text": result["final_article"],
-            "paragraphs": result["paragraphs"],
-        }
+        response = process_response(result, elapsed_time)
+        if deadline_ms:
+            # Cached results are complete articles
+            response.setdefault("degradations", [])
+        if timings:
+            # Cached and already completed runs did not execute, so they have no timings
+            response["timings"] = (
+                {**result["critical_path"], "calls": result["llm_calls"]} if "critical_path" in result else None
+            )
+        return response
     except Exception as e:
         error_details = {
             "error": str(e),
             "traceback": traceback.format_exc(),
-            "type": str(type(e).__name__)
+            "type": str(type(e).__name__),
+            "run_id": getattr(e, "run_id", None)
         }
         logger.error(error_details)
         raise HTTPException(status_code=500, detail=error_details)
 
-@app.get("/graph")
-async def get_graph():
-    try:
-        # Create a unique filename using timestamp
-        filename = f"graph_{int(time.time())}.png"
-        
-        # Generate the graph
-        graph.get_graph().draw_mermaid_png(
-            draw_method=MermaidDrawMethod.API,
-            output_file_path=filename
-        )
-        
-        # Return the file and clean up afterwards
-        return FileResponse(
-            filename,
-            media_type="image/png",
-            filename="workflow_graph.png",
-            background=cleanup_file(filename)
-        )
-    except Exception as e:
-        print(e)
-        print(traceback.format_exc())
-        raise HTTPException(status_code=500, detail=str(traceback.format_exc()))
+def process_response(result: dict, elapsed_time: float) -> dict:
+    response = {
+        "elapsed_time": elapsed_time,
+        "title": result["outline"]["title"],
+        "full_text": result["final_article"],
+        "paragraphs": result["paragraphs"],
+        "cached": result.get("cached", False),
+        "run_id": result.get("run_id"),
+    }
+    if result.get("preprocessing"):
+        response["preprocessing"] = result["preprocessing"]
+    if result.get("fact_check"):
+        response["fact_check"] = result["fact_check"]
+    if "degradations" in result:
+        response["degradations"] = result["degradations"]
+    return response
 
-def cleanup_file(filename: str):
-    """Background task to remove the temporary file after it's sent"""
-    async def cleanup():
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/process/stream")
+async def process_source_stream(request: SourceRequest, cache: bool = True):
+    logger.info("Streaming new request")
+    if request.metadata:
+        logger.info(f"Metadata: {request.metadata}")
+
+    async def events():
         try:
-            os.remove(filename)
-        except Exception:
-            pass
-    return cleanup
+            async for event, data in astream_workflow(
+                input_message=request.get_source(),
+                metadata=request.metadata.dict() if request.metadata else None,
+                variant=request.variant,
+                use_cache=cache,
+                run_id=request.run_id
+            ):
+                yield format_sse(event, data)
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            yield format_sse("error", {"error": str(e), "type": str(type(e).__name__), "run_id": getattr(e, "run_id", None)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/process/batch")
+async def process_batch(request: Request, cache: bool = True,
+                        concurrency: int = Query(BATCH_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY)):
+    """Process a JSON list or JSONL body of SourceRequests, streaming one JSONL
+    result per article in completion order."""
+    body = (await request.body()).decode("utf-8")
+    try:
+        if body.lstrip().startswith("["):
+            raw = json.loads(body)
+        else:
+            raw = [json.loads(line) for line in body.splitlines() if line.strip()]
+        items = [SourceRequest(**item) for item in raw]
+    except (json.JSONDecodeError, TypeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Expected a JSON list or JSONL of source requests: {e}")
+    logger.info(f"Processing batch of {len(items)} articles")
+
+    async def results():
+        requests = [
+            {
+                "source": item.get_source(),
+                "metadata": item.metadata.dict() if item.metadata else None,
+                "run_id": item.run_id,
+                "variant": item.variant,
+            }
+            for item in items
+        ]
+        async for record in run_batch(requests, concurrency=concurrency, use_cache=cache):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    run = await run_status(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run: {run_id}")
+    return run
+
+async def run_job(job_id: str, request: dict) -> dict:
+    """Worker for one queued job. The job id doubles as the run id, so a job
+    picked up again after a crash resumes from its last checkpoint."""
+    job = JobRequest(**request)
+    start_time = time.time()
+    result = await arun_workflow(
+        input_message=job.get_source(),
+        metadata=job.metadata.dict() if job.metadata else None,
+        variant=job.variant,
+        use_cache=job.cache,
+        run_id=job.run_id or job_id
+    )
+    return process_response(result, round(time.time() - start_time, 2))
+
+jobs = None
+
+def job_queue():
+    if jobs is None:
+        raise HTTPException(status_code=503, detail="The job queue is not running")
+    return jobs
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    jobs = job_queue()
+    try:
+        job_id = await jobs.submit(request.dict(), lane=request.lane)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    logger.info(f"Queued job {job_id} ({request.lane})")
+    return {"job_id": job_id, "status": "queued", "position": await asyncio.to_thread(jobs.store.position, job_id)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    jobs = job_queue()
+    job = await asyncio.to_thread(jobs.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if job["status"] == "queued":
+        job["position"] = await asyncio.to_thread(jobs.store.position, job_id)
+    return job
+
+@app.get("/graph")
+async def get_graph(request: Request, variant: Literal["fast", "standard", "full"] = "standard",
+                    format: Literal["auto", "png", "mermaid", "dot"] = "auto"):
+    """The pipeline diagram, drawn locally once per variant and format and served from memory.
+
+    `auto` is a PNG where pygraphviz is installed and Mermaid source otherwise.
+    """
+    if format == "auto":
+        format = "png" if png_available() else "mermaid"
+    elif format == "png" and not png_available():
+        raise HTTPException(status_code=501, detail="PNG rendering needs pygraphviz; use format=mermaid or format=dot")
+    body, media_type, etag = diagrams.get(pipelines.get(variant, llm1, llm2), format)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+@app.get("/stats")
+async def get_stats():
+    return {
+        "pipelines": pipelines.variants(),
+        "result_cache": result_cache.stats() if result_cache else None,
+        "llm_cache": llm_cache_stats(),
+        "single_flight": inflight.stats(),
+        "edit_review": edit_review_stats.as_dict(),
+        "structured_output": structured_stats.as_dict(),
+        "web_search": web_search_stats.as_dict(),
+        "rate_limits": rate_limiter.metrics(),
+        "routing": routing_stats(),
+        "jobs": await jobs.stats() if jobs else None,
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 @app.get("/health")
 async def health_check():
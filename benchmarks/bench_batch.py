@@ -0,0 +1,55 @@
+"""Batch throughput: articles one at a time vs. `run_batch` against a provider concurrency limit.
+
+The fake provider answers every call in `--latency` seconds and the scheduler
+admits at most `--limit` calls at once, so the provider's ceiling is
+limit / latency calls per second. Reports articles per minute and LLM calls
+per second as a share of that ceiling.
+
+Usage: python -m benchmarks.bench_batch [--articles 24] [--latency 0.2] [--limit 24] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .fake_llm import use_fake_models
+
+llm1, llm2 = use_fake_models()
+
+from src.batch import run_batch  # noqa: E402
+from src.ratelimit import rate_limiter  # noqa: E402
+
+
+async def run(articles, concurrency):
+    requests = [{"source": f"第{i}篇测试文章。" * 50} for i in range(articles)]
+    calls = llm1.calls + llm2.calls
+    start = time.perf_counter()
+    failed = 0
+    async for record in run_batch(requests, concurrency=concurrency, use_cache=False):
+        failed += record["status"] != "succeeded"
+    return time.perf_counter() - start, llm1.calls + llm2.calls - calls, failed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--limit", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    llm1.latency = llm2.latency = args.latency
+    os.environ["RATE_LIMIT_CONCURRENCY"] = os.environ["RATE_LIMIT_INITIAL"] = str(args.limit)
+    ceiling = args.limit / args.latency
+    for label, concurrency in (("serial", 1), ("batch", args.concurrency)):
+        rate_limiter._schedulers.clear()
+        elapsed, calls, failed = await run(args.articles, concurrency)
+        print(
+            f"{label:6}  {args.articles - failed}/{args.articles} articles in {elapsed:6.2f}s  "
+            f"{args.articles / elapsed * 60:7.1f} articles/min  {calls / elapsed:6.1f} calls/s "
+            f"({calls / elapsed / ceiling:.0%} of the {ceiling:.0f} calls/s provider ceiling)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
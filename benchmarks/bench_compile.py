@@ -0,0 +1,33 @@
+"""Per-request overhead of building the graph vs. using the pipeline registry.
+
+Usage: python -m benchmarks.bench_compile [iterations]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from src.graph import create_sequential_graph, pipelines, llm1, llm2  # noqa: E402
+
+
+def bench(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / iterations * 1e6
+    print(f"{label:<28} {iterations:>6} calls  {per_call_us:>12.1f} us/call")
+    return per_call_us
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    build = bench("build + compile per request", lambda: create_sequential_graph(llm1, llm2), iterations)
+    lookup = bench("registry lookup", lambda: pipelines.get("standard", llm1, llm2), iterations * 100)
+    print(f"overhead removed per request: {(build - lookup) / 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
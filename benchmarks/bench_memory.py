@@ -0,0 +1,103 @@
+"""Peak memory of many concurrent runs, with and without LEAN_STATE.
+
+Each mode runs in a fresh interpreter, so one mode's allocations cannot hide
+the other's. A run keeps its state (and, with `--checkpoints`, its
+checkpoints and pending writes) alive until it ends, so peak RSS growth over
+the concurrent runs divided by their number is the memory one in-flight
+article costs.
+
+Usage: python -m benchmarks.bench_memory [--articles 100] [--size 20000] [--latency 0.5] [--sections 6]
+           [--checkpoints off|memory|sqlite] [--tracemalloc]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .harness import rss_mb, synthetic_article
+
+
+async def measure(args):
+    from .fake_llm import use_fake_models
+
+    # Sections and paragraph lengths of a typical real article
+    llm1, llm2 = use_fake_models(args.latency, jitter=0.2, seed=0, sections=args.sections, paragraph_chars=1500)
+    from src.checkpoint import CheckpointStore, run_config
+    from src.graph import create_sequential_graph, initial_state
+    from src.llm import llm_cache_disabled
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(args.checkpoints, os.path.join(tmp, "checkpoints.sqlite"))
+        app = create_sequential_graph(llm1, llm2, checkpointer=await store.saver(), lean_state=args.lean)
+        sources = [synthetic_article(i, args.size) for i in range(args.articles)]
+        baseline = rss_mb()
+        peak = [baseline]
+
+        async def sample():
+            while True:
+                peak[0] = max(peak[0], rss_mb())
+                await asyncio.sleep(0.02)
+
+        async def one(i):
+            config = run_config(f"bench-{i}") if args.checkpoints != "off" else None
+            state = await app.ainvoke(initial_state(sources[i]), config)
+            return len(state["messages"])
+
+        sampler = asyncio.ensure_future(sample())
+        if args.tracemalloc:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), llm_cache_disabled():
+            messages = await asyncio.gather(*(one(i) for i in range(args.articles)))
+        elapsed = time.perf_counter() - start
+        heap_peak = tracemalloc.get_traced_memory()[1] / 2**20 if args.tracemalloc else None
+        tracemalloc.stop()
+        sampler.cancel()
+        await store.close()
+    return {
+        "elapsed": round(elapsed, 2),
+        "messages_per_run": max(messages),
+        "rss_growth_mb": round(peak[0] - baseline, 1),
+        "heap_peak_mb": round(heap_peak, 1) if heap_peak is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument("--size", type=int, default=20000, help="article size in characters")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--sections", type=int, default=6)
+    parser.add_argument("--checkpoints", choices=("off", "memory", "sqlite"), default="off")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slow)")
+    parser.add_argument("--lean", type=lambda value: value == "on", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.lean is not None:
+        print(json.dumps(asyncio.run(measure(args))))
+        return
+
+    for lean in ("off", "on"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_memory", "--articles", str(args.articles), "--size", str(args.size),
+             "--latency", str(args.latency), "--sections", str(args.sections), "--checkpoints", args.checkpoints,
+             "--lean", lean, *(["--tracemalloc"] if args.tracemalloc else [])],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"LEAN_STATE={lean:<3}  {args.articles} concurrent {args.size}-char articles (checkpoints {args.checkpoints}): "
+            f"peak RSS +{result['rss_growth_mb']:.1f}MB ({result['rss_growth_mb'] / args.articles * 1024:.0f}KB per run), "
+            + (f"Python heap peak {result['heap_peak_mb']:.1f}MB, " if result["heap_peak_mb"] is not None else "")
+            + f"{result['messages_per_run']} messages per run, {result['elapsed']}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Concurrent articles against a fake provider that returns 429 above a concurrency limit.
+
+Runs the same load with the per-provider scheduler off and on and reports
+failed articles, 429s seen by the provider, throughput and the scheduler's
+queue metrics. The client does no retries of its own (`max_retries=0`), so
+every 429 reaches the scheduler.
+
+Usage: python -m benchmarks.bench_ratelimit [--articles 40] [--latency 0.5] [--max-in-flight 24]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from langchain_openai import ChatOpenAI  # noqa: E402
+
+from src.graph import create_sequential_graph, initial_state  # noqa: E402
+from src.llm import llm_cache_disabled  # noqa: E402
+from src.ratelimit import rate_limiter  # noqa: E402
+from . import fake_openai_server  # noqa: E402
+from .load_async import start_fake_server  # noqa: E402
+
+
+async def run_articles(app, articles):
+    async def one(i):
+        await app.ainvoke(initial_state(f"第{i}篇测试文章。" * 50))
+
+    start = time.perf_counter()
+    with llm_cache_disabled():
+        results = await asyncio.gather(*(one(i) for i in range(articles)), return_exceptions=True)
+    return time.perf_counter() - start, sum(isinstance(r, Exception) for r in results)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-in-flight", type=int, default=24)
+    parser.add_argument("--port", type=int, default=8101)
+    args = parser.parse_args()
+
+    server = start_fake_server(args.port, args.latency)
+    fake_openai_server.LIMITS["max_in_flight"] = args.max_in_flight
+    llm = ChatOpenAI(model="fake", base_url=f"http://127.0.0.1:{args.port}/v1", api_key="bench", max_retries=0)
+    app = create_sequential_graph(llm, llm)
+
+    for enabled in (False, True):
+        rate_limiter.enabled = enabled
+        rate_limiter._schedulers.clear()
+        fake_openai_server.STATS.update(requests=0, max_in_flight=0, throttled=0)
+        elapsed, failed = await run_articles(app, args.articles)
+        stats = fake_openai_server.STATS
+        print(
+            f"scheduler {'on ' if enabled else 'off'}  {args.articles - failed}/{args.articles} articles in {elapsed:6.2f}s  "
+            f"{stats['requests']} requests, {stats['throttled']} got 429, peak {stats['max_in_flight']} in flight "
+            f"(limit {args.max_in_flight})"
+        )
+    for provider, metrics in rate_limiter.metrics().items():
+        print(f"  {provider}: {metrics}")
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""Prompt tokens sent to paragraph_writer with the full article vs. retrieval-scoped excerpts.
+
+Usage: python -m benchmarks.bench_retrieval [sections] [sentences_per_section]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from src.prompts import PARAGRAPH_PROMPT  # noqa: E402
+from src.retrieval import ArticleContext  # noqa: E402
+from src.utils import estimate_tokens  # noqa: E402
+
+TOPICS = ["芯片", "电池", "机器人", "大模型", "自动驾驶", "量子计算", "基因编辑", "卫星互联网", "核聚变", "脑机接口",
+          "GPU", "RISC-V", "open source", "robotaxi", "solid-state"]
+
+
+def synthetic_article(sections, sentences):
+    blocks = []
+    for i in range(sections):
+        topic = TOPICS[i % len(TOPICS)]
+        lines = [
+            f"{topic}方面，第{j}家公司在{2015 + j % 10}年投入了{j * 3 + i}亿元，团队认为{topic}的拐点已经到来。"
+            for j in range(sentences)
+        ]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def main():
+    sections = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    sentences = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    article = synthetic_article(sections, sentences)
+    outline = [
+        {"node_id": f"s{i}", "title": f"{TOPICS[i % len(TOPICS)]}的下一步", "content": f"谁在押注{TOPICS[i % len(TOPICS)]}，投入多少"}
+        for i in range(sections)
+    ]
+
+    start = time.perf_counter()
+    context = ArticleContext(article)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    full = scoped = on_topic = 0
+    start = time.perf_counter()
+    for node in outline:
+        excerpt = context.for_node(node)
+        full += estimate_tokens(PARAGRAPH_PROMPT.format(original_article=article, node=node))
+        scoped += estimate_tokens(PARAGRAPH_PROMPT.format(original_article=excerpt, node=node))
+        topic = TOPICS[int(node["node_id"][1:]) % len(TOPICS)]
+        lines = [line for line in excerpt.split("\n") if line.strip()]
+        on_topic += sum(topic in line for line in lines) / max(len(lines), 1)
+    query_ms = (time.perf_counter() - start) * 1000 / len(outline)
+
+    print(f"article: {estimate_tokens(article)} tokens, {sections} outline nodes, budget {context.budget_tokens} tokens")
+    print(f"index build: {build_ms:.1f} ms, retrieval: {query_ms:.2f} ms per node")
+    print(f"paragraph prompt tokens, full article:   {full}")
+    print(f"paragraph prompt tokens, scoped context: {scoped}")
+    print(f"reduction: {100 * (1 - scoped / full):.1f}%  (on-topic lines in excerpts: {100 * on_topic / len(outline):.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""End-to-end latency with REVIEW_MODE=article, edits and sections, plus a local repetition check.
+
+The fake models take longer the more they write, so the one full-article
+rewrite costs what it would with a real model relative to per-section reviews.
+They echo the text they are asked to review, so the repetition check below
+runs on a fixture with a "review" that removes the flagged phrases; judging
+real review quality needs real models.
+
+Usage: python -m benchmarks.bench_review [sections] [chars_per_second]
+"""
+import asyncio
+import importlib
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from benchmarks.fake_llm import FakeChatModel  # noqa: E402
+from src.edits import edit_review_stats  # noqa: E402
+from src.llm import llm_cache_disabled  # noqa: E402
+from src.pipeline import build_graph  # noqa: E402
+from src.review import find_repetitions  # noqa: E402
+
+FIXTURE = [
+    {"node_id": "s1", "title": "起步", "full_text": "试想一下，一家只有十个人的公司，在三年里做出了全球领先的芯片。这家公司的创始人说，关键在于专注。"},
+    {"node_id": "s2", "title": "融资", "full_text": "试想一下，投资人第一次听到这个计划时的反应。这家公司的创始人说，关键在于专注，他们拒绝了所有无关的订单。"},
+    {"node_id": "s3", "title": "量产", "full_text": "量产阶段的良率只有四成。团队花了半年时间改造产线，最终把良率提升到九成以上。"},
+]
+
+
+def _score(paragraphs):
+    hints = find_repetitions(paragraphs)
+    return sum(len(phrases) for phrases in hints.values()), hints
+
+
+def _remove_hinted(paragraphs, hints):
+    """Stand-in for a perfect review: keep the first occurrence of each flagged phrase."""
+    seen = set()
+    reviewed = []
+    for paragraph in paragraphs:
+        text = paragraph["full_text"]
+        for phrase, _ in hints.get(paragraph["node_id"], []):
+            if phrase in seen:
+                text = text.replace(phrase, "")
+            seen.add(phrase)
+        reviewed.append({**paragraph, "full_text": text})
+    return reviewed
+
+
+async def _run(review_mode, sections, chars_per_second):
+    graph_module = importlib.import_module("src.graph")
+    models = {
+        name: FakeChatModel(model_name=f"fake-{name}", latency=0.2, chars_per_second=chars_per_second,
+                            sections=sections)
+        for name in ("llm1", "llm2")
+    }
+    app = build_graph(graph_module.standard_pipeline(review_mode=review_mode), models)
+    state = graph_module.initial_state("基准测试原文。" * 200, {})
+    start = time.perf_counter()
+    with llm_cache_disabled():
+        await app.ainvoke(state)
+    return time.perf_counter() - start
+
+
+def main():
+    sections = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    chars_per_second = float(sys.argv[2]) if len(sys.argv) > 2 else 400.0
+
+    for mode in ("article", "edits", "sections"):
+        elapsed = asyncio.run(_run(mode, sections, chars_per_second))
+        print(f"REVIEW_MODE={mode:<9} {sections} sections at {chars_per_second:.0f} chars/s: {elapsed:.2f}s")
+
+    edits = edit_review_stats.as_dict()
+    print(f"edit script: {edits['output_tokens']} output tokens vs. {edits['full_rewrite_tokens']} for a full rewrite "
+          f"({100 * edits['output_token_saving']:.1f}% fewer), {edits['applied']} applied, {edits['fallbacks']} fallbacks")
+
+    before, hints = _score(FIXTURE)
+    after, _ = _score(_remove_hinted(FIXTURE, hints))
+    print(f"fixture: {before} repeated phrase occurrences flagged, {after} left after removing them")
+    for node_id, phrases in sorted(hints.items()):
+        print(f"  {node_id}: {[phrase for phrase, _ in phrases]}")
+
+
+if __name__ == "__main__":
+    main()
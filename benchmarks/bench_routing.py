@@ -0,0 +1,100 @@
+"""Paragraph fan-out latency with one endpoint vs. a ModelRouter over two.
+
+Both fake endpoints usually answer in `--latency` seconds (give or take 20%), but
+a `--tail-rate` share of their calls take ten times longer. An article waits for the slowest of
+its `--sections` paragraph calls, so one slow call sets the article's time.
+The second scenario makes the primary fail a share of calls to show failover.
+
+Usage: python -m benchmarks.bench_routing [--articles 60] [--sections 8] [--latency 0.2] [--tail-rate 0.03]
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+from src.llm import call_model, llm_cache_disabled  # noqa: E402
+from src.routing import MIN_SAMPLES, ModelRouter  # noqa: E402
+from .fake_llm import FakeChatModel  # noqa: E402
+
+
+def pct(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+async def article(model, i, sections):
+    start = time.perf_counter()
+    calls = [
+        call_model(model, [HumanMessage(content=f"article {i} section {s}")], node="paragraph_node")
+        for s in range(sections)
+    ]
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    return time.perf_counter() - start, any(isinstance(r, Exception) for r in results)
+
+
+async def run(model, articles, sections, concurrency=8):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await article(model, i, sections)
+
+    with llm_cache_disabled():
+        results = await asyncio.gather(*(one(i) for i in range(articles)))
+    times = [elapsed for elapsed, _ in results]
+    failed = sum(failed for _, failed in results)
+    return times, failed
+
+
+def report(label, times, failed, articles, calls):
+    print(
+        f"{label:<22} article p50 {pct(times, 0.5):5.2f}s  p95 {pct(times, 0.95):5.2f}s  max {max(times):5.2f}s  "
+        f"failed {failed}/{articles}  {calls} LLM calls"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=60)
+    parser.add_argument("--sections", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tail-rate", type=float, default=0.03)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    args = parser.parse_args()
+    random.seed(7)
+
+    def endpoint(name, error_rate=0.0):
+        return FakeChatModel(
+            model_name=name, latency=args.latency, jitter=0.2, tail_rate=args.tail_rate, error_rate=error_rate
+        )
+
+    single = endpoint("fake-a")
+    router = ModelRouter([endpoint("fake-a"), endpoint("fake-b")])
+    # Both need enough samples before the router trusts the primary's p95
+    for model in (single, router):
+        await run(model, MIN_SAMPLES // args.sections + 1, args.sections)
+
+    for label, model in (("single endpoint", single), ("router (hedged)", router)):
+        before = sum(m.calls for m in getattr(model, "endpoints", [model]))
+        times, failed = await run(model, args.articles, args.sections)
+        calls = sum(m.calls for m in getattr(model, "endpoints", [model])) - before
+        report(label, times, failed, args.articles, calls)
+    print(f"  hedges {router.hedges}, won by the hedge {router.hedge_wins}")
+
+    flaky = endpoint("fake-flaky", error_rate=args.error_rate)
+    failover = ModelRouter([flaky, endpoint("fake-b")])
+    for label, model in ((f"flaky ({args.error_rate:.0%} errors)", flaky), ("router (failover)", failover)):
+        flaky.calls = 0
+        times, failed = await run(model, args.articles, args.sections)
+        report(label, times, failed, args.articles, sum(m.calls for m in getattr(model, "endpoints", [model])))
+    print(f"  failovers {failover.failovers}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
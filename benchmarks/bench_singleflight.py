@@ -0,0 +1,49 @@
+"""Fire N identical concurrent /process requests and count pipeline executions.
+
+Exits non-zero unless exactly one pipeline ran and every caller got its result.
+
+Usage: python -m benchmarks.bench_singleflight [concurrency]
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+os.environ["RESULT_CACHE"] = "off"
+os.environ["LLM_CACHE"] = "off"
+
+import httpx  # noqa: E402
+
+from .fake_llm import use_fake_models  # noqa: E402
+
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    llm1, llm2 = use_fake_models(latency=0.2)
+
+    import api
+    from src import inflight
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post("/process", json={"source": "同一篇文章。" * 100}) for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    titles = {response.json()["title"] for response in responses if response.status_code == 200}
+    ok = sum(response.status_code == 200 for response in responses)
+    stats = inflight.stats()
+    print(f"{concurrency} concurrent requests in {elapsed:.2f}s, {ok} succeeded")
+    print(f"pipelines run: {stats['leaders']}, coalesced callers: {stats['coalesced']}")
+    print(f"LLM calls: llm1={llm1.calls} llm2={llm2.calls}")
+
+    if ok != concurrency or stats["leaders"] != 1 or len(titles) != 1:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
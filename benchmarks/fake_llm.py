@@ -0,0 +1,176 @@
+"""Canned, deterministic replies shaped like the real pipeline's LLM output."""
+import ast
+import asyncio
+import importlib
+import json
+import os
+import random
+import re
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+# Importing `src` builds the real clients, which need some key to exist
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ.setdefault("OPENROUTER_API_KEY", "fake")
+
+from src.utils import estimate_tokens  # noqa: E402
+
+OUTLINE_MARKER = "<json-schema>"
+IMPROVE_TITLE_MARKER = "以上是一篇微信公众号文章的大纲"
+EDITS_MARKER = '"op": "delete"'
+EDIT_SECTION = re.compile(r'<section id="([^"]+)"[^>]*>\n(.*?)\n</section>', re.S)
+# Review prompts wrap the text to revise in one of these tags; the fake echoes it back
+REVIEW_TAGS = ("section", "article")
+
+
+def fake_outline(sections=4):
+    return {
+        "node_id": "root",
+        "title": "基准测试文章",
+        "content": "用于压测的假大纲",
+        "children": [
+            {"node_id": f"s{i}", "title": f"第{i}节", "content": f"第{i}节的要点，完整的一句话。"}
+            for i in range(1, sections + 1)
+        ],
+    }
+
+
+def fake_reply(prompt, sections=4, paragraph_chars=400):
+    """Return a plausible completion for whichever pipeline prompt this is."""
+    if OUTLINE_MARKER in prompt:
+        return json.dumps(fake_outline(sections), ensure_ascii=False)
+    if IMPROVE_TITLE_MARKER in prompt:
+        try:
+            outline = ast.literal_eval(prompt.split("\n---")[0].strip())
+        except (ValueError, SyntaxError):
+            outline = fake_outline(sections)
+        return json.dumps(outline, ensure_ascii=False)
+    if EDITS_MARKER in prompt:
+        return json.dumps(fake_edits(prompt), ensure_ascii=False)
+    for tag in REVIEW_TAGS:
+        if f"<{tag}>" in prompt and f"</{tag}>" in prompt:
+            return prompt.split(f"<{tag}>", 1)[1].rsplit(f"</{tag}>", 1)[0].strip()
+    return ("这是一段用于基准测试的文字。" * (paragraph_chars // 14 + 1))[:paragraph_chars]
+
+
+def fake_edits(prompt):
+    """An edit script deleting the first sentence of every section but the first."""
+    edits = []
+    for node_id, text in EDIT_SECTION.findall(prompt)[1:]:
+        sentence = text.split("。")[0]
+        if sentence.strip():
+            edits.append({"op": "delete", "id": node_id, "text": sentence + "。"})
+    return edits
+
+
+class FakeProviderError(Exception):
+    """Stands in for a provider's 5xx response."""
+
+    status_code = 500
+
+
+class FakeChatModel(BaseChatModel):
+    """In-process chat model that returns `fake_reply`.
+
+    Each call takes `latency` seconds, plus one second per `chars_per_second`
+    characters or `tokens_per_second` tokens of output when set, so long
+    rewrites cost more than short ones. With `distribution="uniform"`,
+    durations vary by up to `jitter` of themselves either way; with
+    "lognormal", `latency` is the median and `jitter` the sigma of the log. A
+    `tail_rate` share of calls take `tail_factor` times longer, and an
+    `error_rate` share fail with FakeProviderError. A `seed` makes the whole
+    sequence of durations and failures repeatable.
+    """
+
+    model_name: str = "fake"
+    latency: float = 0.1
+    chars_per_second: float = 0.0
+    tokens_per_second: float = 0.0
+    distribution: str = "uniform"
+    jitter: float = 0.0
+    tail_rate: float = 0.0
+    tail_factor: float = 10.0
+    error_rate: float = 0.0
+    sections: int = 4
+    paragraph_chars: int = 400
+    seed: int | None = None
+    calls: int = 0
+    _random: random.Random = PrivateAttr(default=None)
+
+    def model_post_init(self, context):
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self):
+        return "fake"
+
+    def _reply(self, messages):
+        self.calls += 1
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise FakeProviderError(f"{self.model_name} failed")
+        prompt = "\n".join(str(m.content) for m in messages)
+        return fake_reply(prompt, sections=self.sections, paragraph_chars=self.paragraph_chars)
+
+    def _duration(self, content):
+        duration = self.latency
+        if self.chars_per_second:
+            duration += len(content) / self.chars_per_second
+        if self.tokens_per_second:
+            duration += estimate_tokens(content) / self.tokens_per_second
+        if self.jitter and self.distribution == "lognormal":
+            duration *= self._random.lognormvariate(0.0, self.jitter)
+        elif self.jitter:
+            duration *= self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self.tail_rate and self._random.random() < self.tail_rate:
+            duration *= self.tail_factor
+        return duration
+
+    @staticmethod
+    def _message(messages, content):
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        completion_tokens = estimate_tokens(content)
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._reply(messages)
+        time.sleep(self._duration(content))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._reply(messages)
+        await asyncio.sleep(self._duration(content))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, content))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self._reply(messages)
+        pieces = [content[i:i + 20] for i in range(0, len(content), 20)] or [""]
+        for piece in pieces:
+            await asyncio.sleep(self._duration(content) / len(pieces))
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+
+def use_fake_models(latency=0.1, **settings):
+    """Bind the pipeline's llm1/llm2 to fake models; returns them for inspection.
+
+    `settings` are further FakeChatModel fields, shared by both models; a
+    `seed` gives llm2 the next seed so the two do not draw the same durations.
+    """
+    graph_module = importlib.import_module("src.graph")
+    seed = settings.pop("seed", None)
+    graph_module.llm1 = FakeChatModel(model_name="fake-llm1", latency=latency, seed=seed, **settings)
+    graph_module.llm2 = FakeChatModel(
+        model_name="fake-llm2", latency=latency, seed=seed + 1 if seed is not None else None, **settings
+    )
+    return graph_module.llm1, graph_module.llm2
+
@@ -0,0 +1,112 @@
+"""Local OpenAI-compatible chat completions server with configurable latency.
+
+With `--max-in-flight`, requests beyond that many concurrent ones get a 429,
+like a provider's concurrency limit.
+
+Usage: python -m benchmarks.fake_openai_server [--port 8100] [--latency 0.5] [--max-in-flight 0]
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .fake_llm import fake_reply
+
+LATENCY = {"seconds": 0.5}
+LIMITS = {"max_in_flight": 0}
+STATS = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "throttled": 0}
+
+app = FastAPI()
+
+
+def _prompt(body):
+    return "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+
+
+def _usage(prompt, reply):
+    prompt_tokens = len(prompt) // 2
+    completion_tokens = len(reply) // 2
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = _prompt(body)
+    reply = fake_reply(prompt)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "fake")
+
+    STATS["requests"] += 1
+    if LIMITS["max_in_flight"] and STATS["in_flight"] >= LIMITS["max_in_flight"]:
+        STATS["throttled"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error", "code": 429}},
+            status_code=429,
+            headers={"Retry-After": "1"},
+        )
+    STATS["in_flight"] += 1
+    STATS["max_in_flight"] = max(STATS["max_in_flight"], STATS["in_flight"])
+
+    if body.get("stream"):
+        async def events():
+            try:
+                pieces = [reply[i:i + 20] for i in range(0, len(reply), 20)] or [""]
+                delay = LATENCY["seconds"] / len(pieces)
+                for piece in pieces:
+                    await asyncio.sleep(delay)
+                    chunk = {
+                        "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                        "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                final = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "usage": _usage(prompt, reply),
+                }
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                STATS["in_flight"] -= 1
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    try:
+        await asyncio.sleep(LATENCY["seconds"])
+    finally:
+        STATS["in_flight"] -= 1
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": _usage(prompt, reply),
+    })
+
+
+@app.get("/stats")
+async def stats():
+    return STATS
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-in-flight", type=int, default=0)
+    args = parser.parse_args()
+    LATENCY["seconds"] = args.latency
+    LIMITS["max_in_flight"] = args.max_in_flight
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
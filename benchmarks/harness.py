@@ -0,0 +1,228 @@
+"""Offline benchmark of the whole pipeline: throughput, latency percentiles and memory.
+
+Runs a grid of pipeline variants, article sizes and concurrency levels
+against the compiled graphs (`--target graph`, `create_graph` with no
+checkpointer) or the FastAPI app in process (`--target api`,
+`POST /process?cache=false` through every layer), giving each variant
+(`fast`, `standard`, `full`) its own latency profile. LLM calls go to fake models with a latency and token-rate
+distribution, or replay recorded responses (`--replay`, see
+`benchmarks/replay.py`; pass the recorded requests with `--requests`).
+`--latency 0` measures the pipeline's own overhead.
+
+Save a run with `--save run.json` and compare a later one against it with
+`--compare run.json`.
+
+Usage: python -m benchmarks.harness [--target graph|api] [--variants standard] [--sizes 2000,8000] [--concurrency 1,8,32]
+           [--articles 32] [--latency 0.2] [--tokens-per-second 0] [--distribution uniform|lognormal]
+           [--jitter 0.2] [--seed 0] [--replay recordings.jsonl --requests articles.jsonl]
+           [--tracemalloc] [--save run.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import time
+import tracemalloc
+
+# Keep checkpoints and the job queue in memory unless asked otherwise, so the harness leaves no files behind,
+# and answer the full variant's web searches locally
+os.environ.setdefault("CHECKPOINTS", "memory")
+os.environ.setdefault("JOBS_PATH", ":memory:")
+os.environ.setdefault("WEB_SEARCH_BACKEND", "stub")
+
+from .fake_llm import use_fake_models  # noqa: E402
+from .replay import use_replay_models  # noqa: E402
+
+
+def synthetic_article(index, size):
+    """About `size` characters of varied Chinese prose, distinct per `index`."""
+    sentences = []
+    while sum(map(len, sentences)) < size:
+        j = len(sentences)
+        sentences.append(f"第{index}篇文章的第{j}句讨论主题{j % 7}，并给出第{j % 5}个例子。")
+    return "".join(sentences)[:size]
+
+
+def rss_mb():
+    """Current resident set size; the peak so far where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+
+async def graph_runner():
+    from src.graph import PIPELINES, create_graph, initial_state, llm1, llm2
+    from src.llm import llm_cache_disabled
+
+    apps = {variant: create_graph(variant, llm1, llm2) for variant in PIPELINES}
+
+    async def run(source, variant):
+        with llm_cache_disabled():
+            await apps[variant].ainvoke(initial_state(source))
+
+    return run, None
+
+
+async def api_runner():
+    import httpx
+    import api
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://bench", timeout=None)
+
+    async def run(source, variant):
+        response = await client.post("/process", params={"cache": "false"}, json={"source": source, "variant": variant})
+        response.raise_for_status()
+
+    return run, client.aclose
+
+
+async def run_cell(run, variant, sources, concurrency, models):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+    calls = sum(model.calls for model in models)
+    baseline = rss_mb()
+    peak = [baseline]
+
+    async def sample():
+        while True:
+            peak[0] = max(peak[0], rss_mb())
+            await asyncio.sleep(0.05)
+
+    async def one(source):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await run(source, variant)
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    sampler = asyncio.ensure_future(sample())
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    # Keep the nodes' progress prints out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        await asyncio.gather(*(one(source) for source in sources))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    return {
+        "articles": len(sources),
+        "errors": errors,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 3),
+        "p50": round(percentile(latencies, 0.5), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "p99": round(percentile(latencies, 0.99), 3),
+        "max": round(max(latencies, default=0.0), 3),
+        "llm_calls": sum(model.calls for model in models) - calls,
+        "rss_mb": round(peak[0], 1),
+        "rss_growth_mb": round(peak[0] - baseline, 1),
+        **({"heap_peak_mb": round(tracemalloc.get_traced_memory()[1] / 2**20, 1)} if tracemalloc.is_tracing() else {}),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {
+            (r["target"], r.get("variant", "standard"), r["size"], r["concurrency"]): r for r in json.load(f)["results"]
+        }
+    print(f"\nvs. {baseline_path}")
+    for result in results:
+        before = baseline.get((result["target"], result["variant"], result["size"], result["concurrency"]))
+        if not before:
+            continue
+
+        def change(field):
+            return f"{(result[field] - before[field]) / before[field]:+.1%}" if before[field] else "n/a"
+
+        print(
+            f"{result['target']:5} {result['variant']:8} size {result['size']:>6} c={result['concurrency']:<4} "
+            f"throughput {change('throughput'):>7}  p50 {change('p50'):>7}  p95 {change('p95'):>7}  "
+            f"rss {result['rss_mb'] - before['rss_mb']:+.1f}MB"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", choices=("graph", "api"), default="graph")
+    parser.add_argument("--variants", default="standard", help="pipeline variants, e.g. fast,standard,full")
+    parser.add_argument("--sizes", default="2000,8000", help="article sizes in characters")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--articles", type=int, default=32, help="articles per cell")
+    parser.add_argument("--latency", type=float, default=0.2, help="base seconds per LLM call")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="output token rate; 0 for none")
+    parser.add_argument("--distribution", choices=("uniform", "lognormal"), default="uniform")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replay", help="recordings file to replay instead of fake models")
+    parser.add_argument("--requests", help="JSONL requests to run instead of synthetic articles (for --replay)")
+    parser.add_argument("--speed", type=float, default=1.0, help="scale replayed latencies")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slow)")
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    if args.replay:
+        models = use_replay_models(args.replay, args.speed)
+    else:
+        models = use_fake_models(
+            args.latency, tokens_per_second=args.tokens_per_second, distribution=args.distribution,
+            jitter=args.jitter, seed=args.seed,
+        )
+    if args.tracemalloc:
+        tracemalloc.start()
+    run, close = await (api_runner() if args.target == "api" else graph_runner())
+
+    if args.requests:
+        with open(args.requests, encoding="utf-8") as f:
+            requests = [json.loads(line)["source"] for line in f if line.strip()]
+        grid = [("requests", requests)]
+    else:
+        grid = [
+            (size, [synthetic_article(i, size) for i in range(args.articles)])
+            for size in map(int, args.sizes.split(","))
+        ]
+
+    results = []
+    try:
+        for variant in args.variants.split(","):
+            for size, sources in grid:
+                for concurrency in map(int, args.concurrency.split(",")):
+                    result = {"target": args.target, "variant": variant, "size": size, "concurrency": concurrency,
+                              **await run_cell(run, variant, sources, concurrency, models)}
+                    results.append(result)
+                    print(
+                        f"{args.target:5} {variant:8} size {size:>6} c={concurrency:<4} {result['articles'] - result['errors']}/"
+                        f"{result['articles']} ok  {result['throughput']:7.2f} articles/s  p50 {result['p50']:6.2f}s  "
+                        f"p95 {result['p95']:6.2f}s  p99 {result['p99']:6.2f}s  {result['llm_calls']} calls  "
+                        f"rss {result['rss_mb']:.0f}MB (+{result['rss_growth_mb']:.1f})"
+                        + (f"  heap peak {result['heap_peak_mb']}MB" if "heap_peak_mb" in result else "")
+                    )
+        if args.replay:
+            print(f"replay misses: {sum(model.misses for model in models)}/{sum(model.calls for model in models)} calls")
+    finally:
+        if close:
+            await close()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
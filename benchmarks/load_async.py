@@ -0,0 +1,76 @@
+"""Concurrency of the async pipeline against a local fake OpenAI server.
+
+The old sync `/process` endpoint ran each article on a Starlette threadpool
+worker, so at most 40 articles (the default thread limit) were in flight per
+uvicorn worker. This compares that ceiling with the async path, where every
+article shares one event loop.
+
+Usage: python -m benchmarks.load_async [--articles 120] [--latency 3.0]
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+
+import uvicorn  # noqa: E402
+from langchain_openai import ChatOpenAI  # noqa: E402
+
+from src.graph import create_sequential_graph, initial_state  # noqa: E402
+from . import fake_openai_server  # noqa: E402
+
+STARLETTE_THREAD_LIMIT = 40
+
+
+def start_fake_server(port, latency):
+    fake_openai_server.LATENCY["seconds"] = latency
+    config = uvicorn.Config(fake_openai_server.app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_articles(app, articles, limit=None):
+    semaphore = asyncio.Semaphore(limit or articles)
+
+    async def one(i):
+        async with semaphore:
+            await app.ainvoke(initial_state(f"第{i}篇测试文章。" * 50))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(articles)))
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    server = start_fake_server(args.port, args.latency)
+    base_url = f"http://127.0.0.1:{args.port}/v1"
+    llm = ChatOpenAI(model="fake", base_url=base_url, api_key="bench", max_retries=0)
+    app = create_sequential_graph(llm, llm)
+
+    for label, limit in (("threadpool-bound (40)", STARLETTE_THREAD_LIMIT), ("async", None)):
+        fake_openai_server.STATS.update(requests=0, max_in_flight=0)
+        elapsed = await run_articles(app, args.articles, limit)
+        stats = fake_openai_server.STATS
+        print(
+            f"{label:<22} {args.articles} articles in {elapsed:6.2f}s  "
+            f"{args.articles / elapsed:6.1f} articles/s  "
+            f"{stats['requests']} LLM calls, peak {stats['max_in_flight']} in flight"
+        )
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,211 @@
+"""Record the LLM responses of real runs, and replay them offline.
+
+Recording runs the real pipeline (API keys needed) over a JSONL file of
+requests, as read by `python -m src.batch`, and appends every response of
+llm1/llm2 with its latency and token usage to a recordings file:
+
+    python -m benchmarks.replay articles.jsonl -o recordings.jsonl [--concurrency 4]
+
+`use_replay_models(path)` then binds llm1/llm2 to models that answer each
+prompt with its recorded response after its recorded latency, so benchmarks
+(`python -m benchmarks.harness --replay recordings.jsonl`) see real outputs
+and real timings without calling a provider.
+"""
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import statistics
+import sys
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from .fake_llm import fake_reply
+
+
+def prompt_key(messages):
+    """Hash of a call's messages, the key a recorded response is replayed under."""
+    text = "\x1e".join(f"{message.type}:{message.content}" for message in messages)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class RecordingChatModel(BaseChatModel):
+    """Passes calls to `inner` and appends each response to the recordings file at `path`.
+
+    It reports the inner model's name and endpoint, so it is scheduled and
+    rate limited exactly like the model it wraps.
+    """
+
+    inner: Any
+    path: str
+    role: str
+    model_name: str | None = None
+    openai_api_base: str | None = None
+
+    @property
+    def _llm_type(self):
+        return "recording"
+
+    def _append(self, messages, message, latency, ttft=None):
+        record = {
+            "key": prompt_key(messages),
+            "role": self.role,
+            "model": self.model_name,
+            "latency": round(latency, 4),
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            "content": message.content,
+            "usage": getattr(message, "usage_metadata", None),
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    # `stop` and `kwargs` (the JSON mode of `src/structured.py`, for one) go to the inner model
+    # unchanged, so a recorded call is the call a real run makes
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        message = self.inner.invoke(messages, stop=stop, **kwargs)
+        self._append(messages, message, time.perf_counter() - start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        self._append(messages, message, time.perf_counter() - start)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        start = time.perf_counter()
+        ttft = None
+        message = None
+        async for chunk in self.inner.astream(messages, stop=stop, **kwargs):
+            ttft = ttft if ttft is not None else time.perf_counter() - start
+            message = chunk if message is None else message + chunk
+            yield ChatGenerationChunk(message=chunk)
+        if message is not None:
+            self._append(messages, message, time.perf_counter() - start, ttft)
+
+
+class ReplayChatModel(BaseChatModel):
+    """Answers from the recordings of `role` in `path`, after the recorded latency times `speed`.
+
+    A prompt that was recorded more than once cycles through its responses.
+    A prompt that was never recorded is counted in `misses` and gets
+    `fake_reply` after the median recorded latency.
+    """
+
+    path: str
+    role: str
+    model_name: str = "replay"
+    speed: float = 1.0
+    calls: int = 0
+    misses: int = 0
+    _records: dict = PrivateAttr(default_factory=dict)
+    _median: float = PrivateAttr(default=0.0)
+
+    def model_post_init(self, context):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["role"] == self.role:
+                    self._records.setdefault(record["key"], []).append(record)
+        latencies = [record["latency"] for records in self._records.values() for record in records]
+        self._median = statistics.median(latencies) if latencies else 0.0
+
+    @property
+    def _llm_type(self):
+        return "replay"
+
+    def _lookup(self, messages):
+        self.calls += 1
+        records = self._records.get(prompt_key(messages))
+        if not records:
+            self.misses += 1
+            prompt = "\n".join(str(message.content) for message in messages)
+            return {"content": fake_reply(prompt), "latency": self._median, "ttft": None, "usage": None}
+        # Rotate, so repeated prompts replay their recordings in turn
+        records.append(records.pop(0))
+        return records[-1]
+
+    @staticmethod
+    def _result(record):
+        message = AIMessage(content=record["content"], usage_metadata=record["usage"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        record = self._lookup(messages)
+        time.sleep(record["latency"] * self.speed)
+        return self._result(record)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        record = self._lookup(messages)
+        await asyncio.sleep(record["latency"] * self.speed)
+        return self._result(record)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        record = self._lookup(messages)
+        content = record["content"]
+        ttft = record["ttft"] if record["ttft"] is not None else 0.0
+        pieces = [content[i:i + 20] for i in range(0, len(content), 20)] or [""]
+        await asyncio.sleep(ttft * self.speed)
+        for piece in pieces:
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+            await asyncio.sleep((record["latency"] - ttft) * self.speed / len(pieces))
+
+
+def _primary(model):
+    # Record the endpoint a router tries first; replay has no use for failover
+    return model.endpoints[0] if hasattr(model, "endpoints") else model
+
+
+def record_models(path):
+    """Bind the pipeline's llm1/llm2 to recorders of their primary endpoints."""
+    graph_module = importlib.import_module("src.graph")
+    for role in ("llm1", "llm2"):
+        inner = _primary(getattr(graph_module, role))
+        setattr(graph_module, role, RecordingChatModel(
+            inner=inner, path=path, role=role, model_name=getattr(inner, "model_name", None),
+            openai_api_base=getattr(inner, "openai_api_base", None),
+        ))
+    return graph_module.llm1, graph_module.llm2
+
+
+def use_replay_models(path, speed=1.0):
+    """Bind the pipeline's llm1/llm2 to replays of the recordings in `path`."""
+    graph_module = importlib.import_module("src.graph")
+    graph_module.llm1 = ReplayChatModel(path=path, role="llm1", model_name="replay-llm1", speed=speed)
+    graph_module.llm2 = ReplayChatModel(path=path, role="llm2", model_name="replay-llm2", speed=speed)
+    return graph_module.llm1, graph_module.llm2
+
+
+async def _record(args):
+    from src.batch import read_jsonl, run_batch
+    from src.graph import checkpoints
+
+    record_models(args.output)
+    try:
+        with open(args.input, encoding="utf-8") as f:
+            async for result in run_batch(read_jsonl(f), concurrency=args.concurrency, use_cache=False):
+                print(f"{result['index']}: {result['status']}", file=sys.stderr)
+    finally:
+        await checkpoints.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record LLM responses of real runs for offline replay.")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument("-o", "--output", default="recordings.jsonl", help="recordings file to append to")
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(_record(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
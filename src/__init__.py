@@ -1,4 +1,5 @@
-from .graph import run_workflow, graph, create_sequential_graph
+from .graph import run_workflow, arun_workflow, astream_workflow, graph, create_graph, create_sequential_graph, pipelines, result_cache, inflight
+from .registry import PipelineRegistry
 from .state import State, ParagraphState
 
 from .nodes import (
@@ -9,13 +10,22 @@ from .nodes import (
     final_writer,
     continue_to_paragraphs,
     web_search_writer,
-    content_review_writer
+    content_review_writer,
+    section_review_writer,
+    edit_review_writer
 )
 
 __all__ = [
     'run_workflow',
+    'arun_workflow',
+    'astream_workflow',
     'graph',
+    'create_graph',
     'create_sequential_graph',
+    'pipelines',
+    'result_cache',
+    'inflight',
+    'PipelineRegistry',
     'State',
     'ParagraphState',
     'outline_writer',
@@ -25,5 +35,7 @@ __all__ = [
     'final_writer',
     'continue_to_paragraphs',
     'web_search_writer',
-    'content_review_writer'
+    'content_review_writer',
+    'section_review_writer',
+    'edit_review_writer'
 ]
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""Run many articles at once and stream their results in completion order.
+
+Usage: python -m src.batch articles.jsonl [-o results.jsonl] [--concurrency 16] [--variant standard] [--no-cache]
+
+Each input line is a JSON object with `source` and optionally `metadata`,
+`run_id` and an `id` echoed back in its result. `-` reads from stdin.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+
+from .graph import arun_workflow, checkpoints
+
+logger = logging.getLogger("uvicorn")
+
+# Articles in flight per batch. LLM calls from all of them still queue behind the
+# per-provider schedulers, so this only needs to be high enough to keep those busy.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 16))
+# Upper bound on the concurrency a /process/batch caller may ask for
+BATCH_MAX_CONCURRENCY = max(BATCH_CONCURRENCY, int(os.environ.get("BATCH_MAX_CONCURRENCY", 64)))
+
+
+def read_jsonl(lines):
+    """Parse JSONL lines into request dicts; a malformed line becomes a ValueError in its place."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield ValueError(f"line {number}: {e}")
+            continue
+        if not isinstance(item, dict) or "source" not in item:
+            yield ValueError(f"line {number}: expected an object with a source")
+            continue
+        yield item
+
+
+def _error_record(index, item, error):
+    return {
+        "index": index,
+        "id": item.get("id") if isinstance(item, dict) else None,
+        "status": "failed",
+        "error": str(error),
+        "type": type(error).__name__,
+        "run_id": getattr(error, "run_id", None),
+    }
+
+
+async def _run_item(index, item, use_cache, variant):
+    if isinstance(item, Exception):
+        return _error_record(index, None, item)
+    source = item["source"] if isinstance(item["source"], str) else str(item["source"])
+    start = time.perf_counter()
+    try:
+        result = await arun_workflow(source, item.get("metadata"), item.get("variant") or variant, use_cache, item.get("run_id"))
+    except Exception as e:
+        logger.error(f"batch item {index} failed: {e}")
+        return _error_record(index, item, e)
+    return {
+        "index": index,
+        "id": item.get("id"),
+        "status": "succeeded",
+        "elapsed_time": round(time.perf_counter() - start, 2),
+        "title": result["outline"]["title"],
+        "full_text": result["final_article"],
+        "paragraphs": result["paragraphs"],
+        "cached": result.get("cached", False),
+        "run_id": result.get("run_id"),
+    }
+
+
+async def run_batch(items, concurrency=BATCH_CONCURRENCY, use_cache=True, variant="standard"):
+    """Run every request in `items` and yield one record per request as it finishes.
+
+    `items` may be any iterable, including a lazily read file; at most
+    `concurrency` articles are in flight, and records carry the request's
+    `index` in `items`. A failed article yields a record with `status` "failed"
+    and does not stop the batch. Closing the generator cancels the articles
+    still running.
+    """
+    pending = enumerate(items)
+    results = asyncio.Queue()
+
+    async def worker():
+        # Workers share one iterator, so the input is consumed only as fast as articles finish
+        for index, item in pending:
+            results.put_nowait(await _run_item(index, item, use_cache, variant))
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(concurrency, 1))]
+    finished = asyncio.ensure_future(asyncio.gather(*workers))
+    finished.add_done_callback(lambda _: results.put_nowait(None))
+    try:
+        while (record := await results.get()) is not None:
+            yield record
+        await finished
+    finally:
+        for task in workers:
+            task.cancel()
+
+
+async def _main(args):
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = time.perf_counter()
+    counts = {"succeeded": 0, "failed": 0}
+    try:
+        # The nodes print their progress; keep it out of the JSONL on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            async for record in run_batch(read_jsonl(source), args.concurrency, not args.no_cache, args.variant):
+                counts[record["status"]] += 1
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+    finally:
+        await checkpoints.close()
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    total = counts["succeeded"] + counts["failed"]
+    print(
+        f"{counts['succeeded']}/{total} articles succeeded in {elapsed:.1f}s "
+        f"({total / elapsed * 60 if elapsed else 0:.1f} articles/min)",
+        file=sys.stderr,
+    )
+    return 1 if counts["failed"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process a JSONL file of articles.")
+    parser.add_argument("input", help="JSONL file of requests, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for the results (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="articles in flight")
+    parser.add_argument("--variant", choices=("fast", "standard", "full"), default="standard",
+                        help="pipeline for requests that do not name one")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the result and LLM caches")
+    sys.exit(asyncio.run(_main(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
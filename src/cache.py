@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from .prompts import PROMPT_VERSIONS
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class MemoryCache:
+    """In-process LRU cache with a per-entry time to live."""
+
+    backend = "memory"
+
+    def __init__(self, maxsize=256, ttl=86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._stats.sets += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.backend, "size": len(self._entries), **self._stats.as_dict()}
+
+
+class SQLiteCache:
+    """On-disk cache shared by every process that opens the same file.
+
+    Values are stored as JSON. Hit/miss counters are per process. With a
+    `maxsize`, the entries closest to expiry are evicted first.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path="cache.sqlite", ttl=86400, table="cache", maxsize=None):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.table = table
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] < time.time():
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._stats.evictions += 1
+                row = None
+            if row is None:
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + self.ttl),
+            )
+            self._stats.sets += 1
+            if self.maxsize:
+                evicted = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                ).rowcount
+                self._stats.evictions += max(evicted, 0)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            return {"backend": self.backend, "path": self.path, "size": size, **self._stats.as_dict()}
+
+
+def cache_from_env(prefix, default_backend="memory", default_size=256, default_ttl=86400, table="cache"):
+    """Build a cache from `<prefix>`, `<prefix>_PATH`, `<prefix>_SIZE` and `<prefix>_TTL`.
+
+    `<prefix>` selects the backend: "memory", "sqlite", or "off" for no cache.
+    """
+    backend = os.environ.get(prefix, default_backend).lower()
+    ttl = float(os.environ.get(f"{prefix}_TTL", default_ttl))
+    size = int(os.environ.get(f"{prefix}_SIZE", default_size))
+    if backend in ("off", "none", "0", ""):
+        return None
+    if backend == "sqlite":
+        return SQLiteCache(os.environ.get(f"{prefix}_PATH", "cache.sqlite"), ttl=ttl, table=table, maxsize=size)
+    if backend == "memory":
+        return MemoryCache(size, ttl=ttl)
+    raise ValueError(f"Unknown cache backend for {prefix}: {backend}")
+
+
+def normalize_source(source):
+    """Collapse formatting-only differences so equivalent submissions share a key."""
+    return " ".join(unicodedata.normalize("NFKC", source).split())
+
+
+def result_cache_key(source, metadata, models, variant="standard", settings=None):
+    """Content hash of everything that determines a run's output.
+
+    `settings` holds the process configuration that changes what a run
+    produces, such as the review mode or retrieval budgets.
+    """
+    payload = {
+        "source": normalize_source(source),
+        "metadata": {k: v for k, v in sorted((metadata or {}).items()) if v is not None},
+        "prompts": PROMPT_VERSIONS,
+        "models": list(models),
+        "variant": variant,
+        "settings": settings or {},
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def llm_cache_key(model_id, messages, template=None):
+    """Hash of the fully rendered prompt, the model and the template version it came from."""
+    payload = {
+        "model": model_id,
+        "template": [template, PROMPT_VERSIONS.get(template)] if template else None,
+        "messages": [[message.type, message.content] for message in messages],
+    }
+    encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger("uvicorn")
+
+# 100-ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+_UUID_EPOCH = 0x01B21DD213814000
+
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+
+def run_config(run_id, variant=None):
+    config = {"configurable": {"thread_id": run_id}}
+    if variant:
+        config["metadata"] = {"variant": variant}
+    return config
+
+
+def checkpoint_time(checkpoint_id):
+    """Unix time a checkpoint was written, read from its id (a UUIDv6, as LangGraph assigns them)."""
+    value = uuid.UUID(checkpoint_id).int
+    timestamp = ((value >> 80) << 12) | ((value >> 64) & 0x0FFF)
+    return (timestamp - _UUID_EPOCH) / 1e7
+
+
+async def _latest_checkpoints(saver):
+    """The newest checkpoint id of every thread in `saver`."""
+    if hasattr(saver, "conn"):
+        async with saver.lock, saver.conn.execute(
+            "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+        ) as cursor:
+            return dict(await cursor.fetchall())
+    latest = {}
+    async for checkpoint in saver.alist(None):
+        thread_id = checkpoint.config["configurable"]["thread_id"]
+        checkpoint_id = checkpoint.config["configurable"]["checkpoint_id"]
+        latest[thread_id] = max(latest.get(thread_id, checkpoint_id), checkpoint_id)
+    return latest
+
+
+class CheckpointStore:
+    """The LangGraph checkpointer runs persist their state to (CHECKPOINTS=sqlite|memory|off).
+
+    `AsyncSqliteSaver` has to be created on the event loop that uses it, so
+    the saver is opened lazily by `saver()` and reopened if the loop changes
+    (for example between `asyncio.run` calls in a script).
+
+    A run that completes keeps only its final checkpoint (`compact`). Runs
+    are deleted when their last checkpoint is older than `ttl` seconds; `saver()` prunes them when the
+    store is opened and then at most once per `ttl / 4`.
+    """
+
+    def __init__(self, backend="sqlite", path="checkpoints.sqlite", ttl=86400):
+        self.backend = backend
+        self.path = path
+        self.ttl = ttl
+        self._loop = None
+        self._opening = None
+        self._pruned = 0.0
+
+    async def _open(self):
+        if self.backend == "memory":
+            from langgraph.checkpoint.memory import InMemorySaver
+            return InMemorySaver()
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        conn = aiosqlite.connect(self.path)
+        # The connection's worker thread is not a daemon; a script that never calls close() would hang at exit
+        getattr(conn, "_thread", conn).daemon = True
+        saver = AsyncSqliteSaver(await conn)
+        await saver.setup()
+        return saver
+
+    async def saver(self):
+        """The checkpointer for the running event loop, or None when checkpointing is off."""
+        if self.backend in ("off", "none", "0", ""):
+            return None
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            previous, self._loop = self._opening, loop
+            # The in-memory saver is not tied to a loop and keeps its runs; a SQLite connection is
+            if self.backend == "sqlite" or previous is None:
+                self._opening = asyncio.ensure_future(self._open())
+                if previous is not None and previous.done() and not previous.exception():
+                    await previous.result().conn.close()
+        saver = await asyncio.shield(self._opening)
+        if self.ttl and time.time() - self._pruned > self.ttl / 4:
+            self._pruned = time.time()
+            await self._prune(saver)
+        return saver
+
+    async def _prune(self, saver):
+        cutoff = time.time() - self.ttl
+        latest = await _latest_checkpoints(saver)
+        stale = [thread_id for thread_id, checkpoint_id in latest.items() if checkpoint_time(checkpoint_id) < cutoff]
+        for thread_id in stale:
+            await saver.adelete_thread(thread_id)
+        if stale:
+            logger.info(f"pruned checkpoints of {len(stale)} runs older than {self.ttl}s")
+
+    async def compact(self, run_id):
+        """Keep only the final checkpoint of a completed run: its result and status, nothing to resume."""
+        saver = await self.saver()
+        if saver is None:
+            return
+        if hasattr(saver, "conn"):
+            async with saver.lock, saver.conn.cursor() as cursor:
+                for table in ("checkpoints", "writes"):
+                    await cursor.execute(
+                        f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_id < "
+                        "(SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ?)",
+                        (run_id, run_id),
+                    )
+                await saver.conn.commit()
+            return
+        # In memory, channel values are shared between checkpoints and stay until the run is pruned
+        for namespace, stored in saver.storage.get(run_id, {}).items():
+            latest = max(stored, default=None)
+            for checkpoint_id in [checkpoint_id for checkpoint_id in stored if checkpoint_id != latest]:
+                del stored[checkpoint_id]
+            for key in [key for key in saver.writes if key[:2] == (run_id, namespace) and key[2] != latest]:
+                del saver.writes[key]
+
+    async def close(self):
+        """Close the SQLite connection; its worker thread would otherwise keep the process alive."""
+        opening, self._loop = self._opening, None
+        if self.backend == "sqlite":
+            self._opening = None
+            if opening is not None and opening.done() and not opening.exception():
+                await opening.result().conn.close()
+
+
+def checkpoints_from_env():
+    backend = os.environ.get("CHECKPOINTS", "sqlite").lower()
+    if backend not in ("sqlite", "memory", "off", "none", "0", ""):
+        raise ValueError(f"Unknown checkpoint backend: {backend}")
+    return CheckpointStore(
+        backend,
+        os.environ.get("CHECKPOINTS_PATH", "checkpoints.sqlite"),
+        float(os.environ.get("CHECKPOINTS_TTL", 86400)),
+    )
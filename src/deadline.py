@@ -0,0 +1,123 @@
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+logger = logging.getLogger("uvicorn")
+
+# Seconds of remaining budget each outline section is given when sizing the fan-out
+SECONDS_PER_SECTION = float(os.environ.get("DEADLINE_SECONDS_PER_SECTION", 2))
+# Sections kept however tight the budget
+MIN_SECTIONS = int(os.environ.get("DEADLINE_MIN_SECTIONS", 2))
+# Assumed duration of an optional stage that has not run yet in this process
+DEFAULT_ESTIMATE = float(os.environ.get("DEADLINE_DEFAULT_ESTIMATE", 5))
+
+_current_deadline = ContextVar("deadline", default=None)
+
+
+class Deadline:
+    """A run's latency budget and the degradations applied to stay within it."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.started = time.perf_counter()
+        self.degradations = []
+
+    def remaining(self):
+        return self.budget - (time.perf_counter() - self.started)
+
+    def degrade(self, node, action, **details):
+        at_ms = round((time.perf_counter() - self.started) * 1000)
+        logger.info(f"deadline: {action} {node} at {at_ms}ms {details or ''}")
+        self.degradations.append({"node": node, "action": action, "at_ms": at_ms, **details})
+
+
+@contextmanager
+def run_deadline(deadline_ms):
+    """Scope in which nodes keep the run within `deadline_ms`; yields the Deadline, or None without one."""
+    if not deadline_ms:
+        yield None
+        return
+    deadline = Deadline(deadline_ms / 1000)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+class StageEstimates:
+    """Exponentially weighted mean duration per node, seeded with DEFAULT_ESTIMATE."""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self._means = {}
+        self._lock = threading.Lock()
+
+    def record(self, node, seconds):
+        with self._lock:
+            mean = self._means.get(node)
+            self._means[node] = seconds if mean is None else mean + self.alpha * (seconds - mean)
+
+    def get(self, node):
+        return self._means.get(node, DEFAULT_ESTIMATE)
+
+
+stage_estimates = StageEstimates()
+
+
+def cap_sections(outline, node="outline_node"):
+    """Drop trailing outline sections the run's remaining budget cannot pay for."""
+    deadline = current_deadline()
+    children = outline.get("children", [])
+    if deadline is None:
+        return outline
+    limit = max(MIN_SECTIONS, int(deadline.remaining() / SECONDS_PER_SECTION))
+    if len(children) <= limit:
+        return outline
+    deadline.degrade(node, "capped_sections", sections=len(children), kept=limit)
+    return {**outline, "children": children[:limit]}
+
+
+def deadline_bound(name, func, optional=False, fallback=None):
+    """Wrap an async node so it yields to the run's deadline.
+
+    An `optional` node is skipped when its estimated duration exceeds the
+    remaining budget, and its update dropped if it is still running at the
+    deadline. A node with a `fallback` is cancelled at the deadline and
+    returns `fallback(state)` instead. Without a deadline the node runs as
+    is; either way its duration feeds `stage_estimates`.
+    """
+    if not inspect.iscoroutinefunction(func):
+        raise TypeError(f"{name} must be async to be bound by a deadline")
+
+    @wraps(func)
+    async def wrapper(state):
+        deadline = current_deadline()
+        if deadline is not None and optional and deadline.remaining() < stage_estimates.get(name):
+            deadline.degrade(name, "skipped", estimate_ms=round(stage_estimates.get(name) * 1000))
+            return {}
+        start = time.perf_counter()
+        if deadline is None:
+            update = await func(state)
+        else:
+            try:
+                update = await asyncio.wait_for(func(state), max(deadline.remaining(), 0))
+            except asyncio.TimeoutError:
+                node = state.get("node")
+                node_id = node.get("node_id") if isinstance(node, dict) else None
+                deadline.degrade(name, "cancelled", **({"node_id": node_id} if node_id else {}))
+                return fallback(state) if fallback else {}
+        stage_estimates.record(name, time.perf_counter() - start)
+        return update
+
+    return wrapper
@@ -0,0 +1,71 @@
+import functools
+import hashlib
+import threading
+
+# Media type of each diagram format; "png" needs pygraphviz, the text formats need nothing
+FORMATS = {
+    "mermaid": "text/vnd.mermaid; charset=utf-8",
+    "dot": "text/vnd.graphviz; charset=utf-8",
+    "png": "image/png",
+}
+
+
+@functools.cache
+def png_available():
+    try:
+        import pygraphviz  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def to_dot(graph):
+    """Graphviz DOT source of a LangGraph drawable graph; conditional edges are dashed."""
+    lines = ["digraph pipeline {", "  rankdir=TB;", "  node [shape=box, style=rounded];"]
+    for node in graph.nodes.values():
+        lines.append(f'  "{node.id}" [label="{node.name}"];')
+    for edge in graph.edges:
+        lines.append(f'  "{edge.source}" -> "{edge.target}"' + (" [style=dashed];" if edge.conditional else ";"))
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def render(app, fmt):
+    """The diagram of a compiled graph as bytes, drawn locally without network access."""
+    graph = app.get_graph()
+    if fmt == "mermaid":
+        return graph.draw_mermaid().encode("utf-8")
+    if fmt == "dot":
+        return to_dot(graph).encode("utf-8")
+    if fmt == "png":
+        return graph.draw_png()
+    raise ValueError(f"Unknown diagram format: {fmt}")
+
+
+class DiagramCache:
+    """Rendered diagrams per compiled graph and format, with their ETags.
+
+    Compiled graphs are immutable, so a diagram is drawn once per process and
+    served from memory afterwards.
+    """
+
+    def __init__(self):
+        self._diagrams = {}
+        self._lock = threading.Lock()
+
+    def get(self, app, fmt):
+        """(body, media type, etag) for `app` drawn as `fmt`."""
+        key = (id(app), fmt)
+        diagram = self._diagrams.get(key)
+        if diagram is None:
+            with self._lock:
+                diagram = self._diagrams.get(key)
+                if diagram is None:
+                    body = render(app, fmt)
+                    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                    # Holding the app keeps its id from being reused by another graph
+                    diagram = self._diagrams[key] = (body, FORMATS[fmt], etag, app)
+        return diagram[:3]
+
+
+diagrams = DiagramCache()
@@ -0,0 +1,91 @@
+import json
+import threading
+from .utils import remove_json_markers, estimate_tokens
+
+OPS = ("delete", "replace")
+
+
+class EditError(ValueError):
+    """An edit script that cannot be parsed or whose anchors do not match the article."""
+
+
+def render_sections(paragraphs):
+    """The article body as id-tagged sections, the anchors an edit script refers to."""
+    return "\n".join(
+        f'<section id="{p["node_id"]}" title="{p["title"]}">\n{p["full_text"]}\n</section>'
+        for p in paragraphs
+    )
+
+
+def parse_edits(text):
+    """Parse a model's edit script into a list of {op, id, text[, with]} dicts."""
+    try:
+        edits = json.loads(remove_json_markers(text))
+    except json.JSONDecodeError as e:
+        raise EditError(f"edit script is not JSON: {e}") from e
+    if not isinstance(edits, list):
+        raise EditError("edit script is not a list")
+    for edit in edits:
+        if not isinstance(edit, dict) or edit.get("op") not in OPS:
+            raise EditError(f"unknown edit: {edit}")
+        if not isinstance(edit.get("id"), str) or not isinstance(edit.get("text"), str) or not edit["text"].strip():
+            raise EditError(f"edit without an anchor: {edit}")
+        if edit["op"] == "replace" and not isinstance(edit.get("with"), str):
+            raise EditError(f"replace without replacement text: {edit}")
+    return edits
+
+
+def apply_edits(paragraphs, edits):
+    """Apply `edits` in order and return new paragraphs; the input is left untouched.
+
+    Each edit's `text` must occur verbatim in the section named by `id` at the
+    time it is applied; the first occurrence is changed. Any mismatch raises
+    EditError and nothing is applied.
+    """
+    texts = {p["node_id"]: p["full_text"] for p in paragraphs}
+    for edit in edits:
+        if edit["id"] not in texts:
+            raise EditError(f"unknown section id: {edit['id']}")
+        anchor = edit["text"].strip()
+        if anchor not in texts[edit["id"]]:
+            raise EditError(f"anchor not found in {edit['id']}: {anchor}")
+        replacement = edit.get("with", "") if edit["op"] == "replace" else ""
+        texts[edit["id"]] = texts[edit["id"]].replace(anchor, replacement, 1)
+    return [{**p, "full_text": texts[p["node_id"]]} for p in paragraphs]
+
+
+class EditReviewStats:
+    """How often edit scripts applied cleanly, and the output tokens they cost vs. full rewrites."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.applied = 0
+        self.fallbacks = 0
+        self.edits = 0
+        self.output_tokens = 0
+        self.rewrite_tokens = 0
+
+    def record(self, script, article, edits=None):
+        """Record one review; `edits` is None when it fell back to a full rewrite."""
+        with self._lock:
+            if edits is None:
+                self.fallbacks += 1
+                return
+            self.applied += 1
+            self.edits += len(edits)
+            self.output_tokens += estimate_tokens(script)
+            self.rewrite_tokens += estimate_tokens(article)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "applied": self.applied,
+                "fallbacks": self.fallbacks,
+                "edits": self.edits,
+                "output_tokens": self.output_tokens,
+                "full_rewrite_tokens": self.rewrite_tokens,
+                "output_token_saving": round(1 - self.output_tokens / self.rewrite_tokens, 4) if self.rewrite_tokens else 0.0,
+            }
+
+
+edit_review_stats = EditReviewStats()
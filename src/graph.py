@@ -1,12 +1,33 @@
 import os
+import asyncio
+import time
+from contextlib import nullcontext
+from functools import partial
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph, START, END
+import logging
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
-from .state import State
+from .pipeline import NodeSpec, build_graph, resolve_dependencies
+from .registry import PipelineRegistry
+from .timing import RunTimer, critical_path_report
+from .metrics import observe_run
+from .cache import cache_from_env, result_cache_key
+from .utils import model_identity
+from .llm import llm_cache_disabled
+from .singleflight import SingleFlight
+from .routing import routed
+from .ratelimit import CLIENT_MAX_RETRIES
+from .checkpoint import checkpoints_from_env, new_run_id, run_config
+from .deadline import run_deadline
+from .web_search import BACKEND as WEB_SEARCH_BACKEND, MAX_CHARS as WEB_SEARCH_MAX_CHARS
+from .preprocess import PREPROCESS_CHUNK_TOKENS, PREPROCESS_TARGET_TOKENS, PREPROCESS_THRESHOLD_TOKENS
+from .retrieval import CHUNK_TOKENS, PARAGRAPH_CONTEXT_TOKENS
 from .nodes import (
     outline_writer,
+    streaming_outline_writer,
+    collect_paragraphs_writer,
+    paragraph_prefetch,
     paragraph_writer,
+    paragraph_fallback,
     final_writer,
     insights_writer,
     transcript_writer,
@@ -16,14 +37,19 @@ from .nodes import (
     web_search_writer,
     summarize_writer,
     content_review_writer,
-    preface_writer
+    section_review_writer,
+    edit_review_writer,
+    preface_writer,
+    fact_checker
 )
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger("uvicorn")
+
 # openai
-llm1 = ChatOpenAI(model="gpt-4o-mini")
+llm1 = ChatOpenAI(model="gpt-4o-mini", max_retries=CLIENT_MAX_RETRIES)
 # openai_llm = openai_llm.bind(response_format={"type": "json_object"})
 
 # deepseek
@@ -35,7 +61,8 @@ llm1 = ChatOpenAI(model="gpt-4o-mini")
 llm2 = ChatOpenAI(
     model="deepseek/deepseek-chat",
     base_url="https://openrouter.ai/api/v1",
-    api_key=os.environ.get("OPENROUTER_API_KEY")
+    api_key=os.environ.get("OPENROUTER_API_KEY"),
+    max_retries=CLIENT_MAX_RETRIES,
     )
 # llm2 = ChatOpenAI(
 #     model="deepseek/deepseek-v3",
@@ -45,7 +72,8 @@ llm2 = ChatOpenAI(
 llm4 = ChatOpenAI(
     model="deepseek/deepseek-r1",
     base_url="https://openrouter.ai/api/v1",
-    api_key=os.environ.get("OPENROUTER_API_KEY")
+    api_key=os.environ.get("OPENROUTER_API_KEY"),
+    max_retries=CLIENT_MAX_RETRIES,
     )
 # llm2 = ChatOpenAI(
 #     model="deepseek-ai/DeepSeek-V3",
@@ -60,49 +88,145 @@ llm4 = ChatOpenAI(
 #     api_key=os.environ.get("DEEPSEEK_API_KEY")
 #     )
 
-def create_sequential_graph(llm1, llm2):
-    # Create a new graph
-    workflow = StateGraph(State)
-
-    # Nodes
-    workflow.add_node("outline_node", lambda state: outline_writer(state, llm2))
-    workflow.add_node("paragraph_node", lambda state: paragraph_writer(state, llm2))
-    workflow.add_node("insights_node", lambda state: insights_writer(state, llm1))
-    workflow.add_node("transcript_node", lambda state: transcript_writer(state, llm1))
-    workflow.add_node("end_node", lambda state: final_writer(state))
-    workflow.add_node("content_review_node", lambda state: content_review_writer(state, llm1))
-    workflow.add_node("preface_node", lambda state: preface_writer(state, llm1))
-    workflow.add_node("improve_title_node", lambda state: improve_title_writer(state, llm2))
-    # workflow.add_node("web_search_node", lambda state: web_search_writer(state))
-    # workflow.add_node("fact_checker", lambda state: fact_checker(state, llm1))
-    # workflow.add_node("summarize_node", lambda state: summarize_writer(state, llm2))
-    
-    # Create the sequential flow
-    workflow.add_edge(START, "outline_node")
-    # All parallel
-    workflow.add_edge("outline_node", "preface_node")
-    workflow.add_conditional_edges("outline_node", continue_to_paragraphs, ["paragraph_node"])
-    # workflow.add_edge("outline_node", "transcript_node")
-    workflow.add_edge("outline_node", "insights_node")
-    workflow.add_edge("outline_node", "improve_title_node")
-    # End
-    workflow.add_edge(["preface_node", "improve_title_node", "paragraph_node", "insights_node"], "end_node")
-    workflow.add_edge("end_node", "content_review_node")
-    workflow.add_edge("content_review_node", END)
-
-    # Compile the graph
-    app = workflow.compile()
-
-    return app
+# Other endpoints serving the same models, used for failover and hedging when their keys are set
+LLM1_ALTERNATIVES = [
+    ("openai/gpt-4o-mini", "https://openrouter.ai/api/v1", "OPENROUTER_API_KEY"),
+]
+LLM2_ALTERNATIVES = [
+    ("deepseek-chat", "https://api.deepseek.com/v1", "DEEPSEEK_API_KEY"),
+    ("deepseek-ai/DeepSeek-V3", "https://api.siliconflow.cn/v1", "SILICONFLOW_API_KEY"),
+    ("deepseek/deepseek-v3", "https://api.ppinfra.com/v3/openai", "PPINFRA_API_KEY"),
+]
 
-# Example usage
-def run_workflow(input_message, metadata=None):
-    # Create the graph
-    app = create_sequential_graph(llm1, llm2)
+def alternatives(endpoints):
+    return [
+        ChatOpenAI(model=model, base_url=base_url, api_key=os.environ[key], max_retries=CLIENT_MAX_RETRIES)
+        for model, base_url, key in endpoints if os.environ.get(key)
+    ]
+
+llm1 = routed(llm1, alternatives(LLM1_ALTERNATIVES))
+llm2 = routed(llm2, alternatives(LLM2_ALTERNATIVES))
+
+# Stream the outline and write each paragraph as soon as its section is parsed
+STREAM_OUTLINE = os.environ.get("STREAM_OUTLINE", "").lower() in ("1", "true", "yes")
+# "article" rewrites the assembled article in one call, "edits" asks for an edit script over its
+# sections instead, and "sections" reviews sections in parallel
+REVIEW_MODE = os.environ.get("REVIEW_MODE", "article").lower()
+# Drop the LLM responses nodes append to `messages` instead of keeping them for the whole run
+LEAN_STATE = os.environ.get("LEAN_STATE", "on").lower() not in ("off", "0", "false", "no")
+
+# Each node declares the state it reads and writes; edges are derived from that,
+# so nodes that only need the run inputs start at START alongside the outline.
+def outline_stages(stream_outline=False, web_search=False):
+    if stream_outline:
+        # Paragraphs start while the outline streams; paragraph_node collects them
+        return [
+            NodeSpec("outline_node", streaming_outline_writer, reads=("original_article",),
+                     writes=("outline", "preprocessing"), model="llm2"),
+            NodeSpec("paragraph_node", collect_paragraphs_writer, reads=("original_article", "outline"),
+                     writes=("paragraphs",), model="llm2"),
+        ]
+    outline = NodeSpec("outline_node", outline_writer, reads=("original_article",), writes=("outline", "preprocessing"),
+                       model="llm2")
+    if not web_search:
+        return [
+            outline,
+            NodeSpec("paragraph_node", paragraph_writer, reads=("original_article", "outline"), writes=("paragraphs",),
+                     model="llm2", fan_out=continue_to_paragraphs, fallback=paragraph_fallback),
+        ]
+    # Sections are searched in parallel between the outline and the paragraphs that use the results
+    return [
+        outline,
+        NodeSpec("web_search_node", web_search_writer, reads=("outline",), writes=("web_context",), optional=True),
+        NodeSpec("paragraph_node", paragraph_writer, reads=("original_article", "outline", "web_context"),
+                 writes=("paragraphs",), model="llm2", fan_out=continue_to_paragraphs, fallback=paragraph_fallback),
+    ]
+
+def fast_pipeline(stream_outline=False):
+    """Outline and paragraphs only: no preface, highlights, title pass or review."""
+    return [*outline_stages(stream_outline), *review_stages("none")]
+
+def standard_pipeline(stream_outline=False, review_mode="article", web_search=False):
+    return [
+        *outline_stages(stream_outline, web_search),
+        NodeSpec("preface_node", preface_writer, reads=("metadata",), writes=("preface",), model="llm1", optional=True),
+        NodeSpec("insights_node", insights_writer, reads=("original_article",), writes=("insights",), model="llm1",
+                 optional=True),
+        # NodeSpec("summarize_node", summarize_writer, reads=("original_article",), writes=("original_article",), model="llm2"),
+        NodeSpec("improve_title_node", improve_title_writer, reads=("outline",), writes=("outline",), model="llm2",
+                 optional=True),
+        *review_stages(review_mode),
+    ]
+
+def full_pipeline(stream_outline=False, review_mode="article"):
+    """The standard pipeline plus web context per section, a transcript of the source and a fact
+    check of the finished article. Sections dispatched while a streamed outline arrives cannot
+    wait for their searches, so STREAM_OUTLINE leaves web search out."""
+    standard = standard_pipeline(stream_outline, review_mode, web_search=not stream_outline)
+    # The transcript follows the outline as written, so it goes in before the title pass rewrites it
+    position = next(i for i, spec in enumerate(standard) if spec.name == "improve_title_node")
+    return [
+        *standard[:position],
+        NodeSpec("transcript_node", transcript_writer, reads=("original_article", "outline"), writes=("transcript",),
+                 model="llm1"),
+        *standard[position:],
+        NodeSpec("fact_checker", fact_checker, reads=("original_article", "final_article"), writes=("fact_check",),
+                 model="llm1", optional=True),
+    ]
+
+def review_stages(review_mode):
+    end = NodeSpec("end_node", final_writer, reads=("outline", "paragraphs", "insights", "preface", "transcript", "metadata"),
+                   writes=("final_article",))
+    if review_mode == "none":
+        return [end]
+    if review_mode == "sections":
+        # Review each section in parallel before assembly instead of rewriting the whole article after it
+        return [
+            NodeSpec("section_review_node", section_review_writer, reads=("paragraphs",), writes=("paragraphs",), model="llm1",
+                     optional=True),
+            end,
+        ]
+    if review_mode == "article":
+        return [
+            end,
+            NodeSpec("content_review_node", content_review_writer, reads=("final_article",), writes=("final_article",), model="llm1",
+                     optional=True),
+        ]
+    if review_mode == "edits":
+        return [
+            end,
+            NodeSpec("edit_review_node", edit_review_writer, reads=("paragraphs", "final_article"),
+                     writes=("paragraphs", "final_article"), model="llm1", optional=True),
+        ]
+    raise ValueError(f"Unknown REVIEW_MODE: {review_mode}")
+
+# Variants a request can choose with `variant`
+PIPELINES = {
+    "fast": fast_pipeline(STREAM_OUTLINE),
+    "standard": standard_pipeline(STREAM_OUTLINE, REVIEW_MODE),
+    "full": full_pipeline(STREAM_OUTLINE, REVIEW_MODE),
+}
+PIPELINE_DEPS = {variant: resolve_dependencies(specs) for variant, specs in PIPELINES.items()}
+
+def outline_first(deps):
+    """The previous wiring, where preface and insights waited for the outline; the baseline
+    of the per-run critical-path report."""
+    return {**deps, **{node: ["outline_node"] for node in ("preface_node", "insights_node") if node in deps}}
 
-    # Initialize the state
-    initial_state = {
+def create_graph(variant, llm1, llm2, checkpointer=None, lean_state=LEAN_STATE):
+    return build_graph(PIPELINES[variant], {"llm1": llm1, "llm2": llm2}, checkpointer=checkpointer, lean_state=lean_state)
+
+def create_sequential_graph(llm1, llm2, checkpointer=None, lean_state=LEAN_STATE):
+    return create_graph("standard", llm1, llm2, checkpointer=checkpointer, lean_state=lean_state)
+
+# Compiled pipelines, shared by every request
+pipelines = PipelineRegistry({variant: partial(create_graph, variant) for variant in PIPELINES})
+pipelines.warm(llm1, llm2)
+
+def initial_state(input_message, metadata=None):
+    return {
         "original_article": input_message,
+        "preprocessing": {},
         "final_article": "",
         "messages": [],
         "outline": {},
@@ -110,12 +234,280 @@ def run_workflow(input_message, metadata=None):
         "insights": "",
         "paragraphs": [],
         "metadata": metadata,
-        "preface": ""
+        "preface": "",
+        "fact_check": "",
+        "web_context": {}
+    }
+
+# Whole-run results for repeated submissions (RESULT_CACHE=memory|sqlite|off)
+result_cache = cache_from_env("RESULT_CACHE")
+
+# Concurrent runs of the same source share one execution
+inflight = SingleFlight()
+
+# Run state is saved after every step so a failed run can resume (CHECKPOINTS=sqlite|memory|off)
+checkpoints = checkpoints_from_env()
+# Run ids executing in this process
+running = set()
+
+# Configuration that changes a run's output; the review mode also picks which review prompt is used
+RESULT_SETTINGS = {
+    "review_mode": REVIEW_MODE,
+    "stream_outline": STREAM_OUTLINE,
+    "paragraph_context_tokens": PARAGRAPH_CONTEXT_TOKENS,
+    "retrieval_chunk_tokens": CHUNK_TOKENS,
+    "preprocess_tokens": [PREPROCESS_THRESHOLD_TOKENS, PREPROCESS_TARGET_TOKENS, PREPROCESS_CHUNK_TOKENS],
+}
+
+# Variants whose output also depends on where web search results come from
+WEB_SEARCH_SETTINGS = {"web_search_backend": WEB_SEARCH_BACKEND, "web_search_max_chars": WEB_SEARCH_MAX_CHARS}
+RUN_SETTINGS = {
+    variant: {**RESULT_SETTINGS, **WEB_SEARCH_SETTINGS} if any(spec.name == "web_search_node" for spec in specs)
+    else RESULT_SETTINGS
+    for variant, specs in PIPELINES.items()
+}
+
+def _run_key(input_message, metadata, variant):
+    return result_cache_key(
+        input_message, metadata, [model_identity(llm1), model_identity(llm2)], variant, RUN_SETTINGS[variant]
+    )
+
+def _cacheable(result):
+    return {
+        "outline": result["outline"],
+        "final_article": result["final_article"],
+        "paragraphs": result["paragraphs"],
+        "fact_check": result.get("fact_check", ""),
     }
 
-    # Run the workflow
-    result = app.invoke(initial_state)
+async def _prepare(input_message, metadata, variant, run_id):
+    """The compiled graph, its input and its config for a run.
+
+    A run id with an unfinished checkpoint resumes from it: the input is None,
+    and only nodes that failed or never started are executed.
+    """
+    saver = await checkpoints.saver()
+    # Look up the precompiled graph
+    app = pipelines.get(variant, llm1, llm2, checkpointer=saver)
+    if saver is None:
+        return app, initial_state(input_message, metadata), None
+    config = run_config(run_id, variant)
+    snapshot = await app.aget_state(config)
+    if snapshot.next:
+        logger.info(f"resuming run {run_id} at {snapshot.next}")
+        return app, None, config
+    return app, initial_state(input_message, metadata), config
+
+async def _stored_run(run_id):
+    """(variant, state snapshot) of a checkpointed run, or None if there is no such run."""
+    saver = await checkpoints.saver()
+    checkpoint = await saver.aget_tuple(run_config(run_id)) if saver else None
+    if checkpoint is None:
+        return None
+    variant = checkpoint.metadata.get("variant", "standard")
+    app = pipelines.get(variant, llm1, llm2, checkpointer=saver)
+    return variant, await app.aget_state(run_config(run_id))
 
+async def _execute(input_message, metadata, variant, use_cache, key, run_id, deadline_ms=None):
+    app, graph_input, config = await _prepare(input_message, metadata, variant, run_id)
+
+    # Run the workflow; every node awaits its LLM call, so many runs share one event loop
+    running.add(run_id)
+    try:
+        with RunTimer() as timer, run_deadline(deadline_ms) as deadline, paragraph_prefetch(), \
+                (nullcontext() if use_cache else llm_cache_disabled()):
+            result = await app.ainvoke(graph_input, config)
+    except Exception as e:
+        # Tells every caller sharing this run which id to retry it with
+        e.run_id = run_id
+        raise
+    finally:
+        running.discard(run_id)
+    await checkpoints.compact(run_id)
+
+    result["run_id"] = run_id
+    deps = PIPELINE_DEPS[variant]
+    result["critical_path"] = critical_path_report(timer, deps, outline_first(deps))
+    result["llm_calls"] = [call.as_dict(timer.started) for call in timer.calls]
+    observe_run(variant, time.perf_counter() - timer.started)
+    logger.info(f"critical path: {result['critical_path']}")
+    if deadline is not None:
+        result["degradations"] = deadline.degradations
+    # A degraded article is only good for the caller whose budget forced it
+    if use_cache and result_cache is not None and not result.get("degradations"):
+        result_cache.set(key, _cacheable(result))
     return result
 
-graph = create_sequential_graph(llm1, llm2)
\ No newline at end of file
+async def arun_workflow(input_message, metadata=None, variant="standard", use_cache=True, run_id=None, deadline_ms=None):
+    """Run the pipeline and return its final state.
+
+    Passing the `run_id` of an earlier run that failed resumes it from its
+    last checkpoint instead of starting over. With `deadline_ms`, optional
+    stages are skipped or cut short and the outline's fan-out is capped to
+    stay within the budget; what was dropped is listed under `degradations`.
+    """
+    key = _run_key(input_message, metadata, variant)
+    stored = await _stored_run(run_id) if run_id else None
+    if stored:
+        variant, snapshot = stored
+        if not snapshot.next:
+            return {**snapshot.values, "run_id": run_id}
+        return await inflight.do(f"run:{run_id}", lambda: _execute(input_message, metadata, variant, use_cache, key, run_id,
+                                                                  deadline_ms))
+    run_id = run_id or new_run_id()
+
+    if use_cache and result_cache is not None:
+        cached = result_cache.get(key)
+        if cached is not None:
+            logger.info(f"result cache hit: {key}")
+            return {**cached, "cached": True}
+
+    if not use_cache or deadline_ms:
+        # An explicitly fresh run never joins one that may be served from cache, and a run
+        # under a deadline neither waits on an unbounded one nor hands others its degraded result
+        return await _execute(input_message, metadata, variant, use_cache, key, run_id, deadline_ms)
+    return await inflight.do(key, lambda: _execute(input_message, metadata, variant, use_cache, key, run_id))
+
+def _node_events(node, update):
+    """Translate one node's state update into stream events."""
+    if node == "outline_node":
+        yield "outline", {"outline": update["outline"]}
+    elif node == "improve_title_node":
+        yield "titles", {"outline": update["outline"]}
+    elif node == "preface_node":
+        yield "preface", {"text": update["preface"]}
+    elif node == "insights_node":
+        yield "insights", {"text": update["insights"]}
+    elif node in ("paragraph_node", "section_review_node", "edit_review_node"):
+        for paragraph in update.get("paragraphs", []):
+            yield "paragraph", paragraph
+    elif node == "transcript_node":
+        yield "transcript", {"text": update["transcript"]}
+    elif node == "end_node":
+        yield "draft", {"full_text": update["final_article"]}
+    elif node == "fact_checker":
+        yield "fact_check", {"text": update["fact_check"]}
+
+async def astream_workflow(input_message, metadata=None, variant="standard", use_cache=True, run_id=None):
+    """Run the workflow and yield (event, data) pairs as nodes complete.
+
+    The event schema is documented in README.md under "Streaming". As with
+    `arun_workflow`, the `run_id` of a failed run resumes it.
+    """
+    stored = await _stored_run(run_id) if run_id else None
+    if stored:
+        variant = stored[0]
+    run_id = run_id or new_run_id()
+    yield "start", {"variant": variant, "run_id": run_id}
+
+    if stored and not stored[1].next:
+        values = stored[1].values
+        yield "done", {
+            "elapsed_time": 0.0,
+            "title": values["outline"]["title"],
+            "full_text": values["final_article"],
+            "paragraphs": values["paragraphs"],
+            "cached": False,
+        }
+        return
+
+    key = _run_key(input_message, metadata, variant) if use_cache and result_cache is not None else None
+    cached = result_cache.get(key) if key and not stored else None
+    if cached is not None:
+        logger.info(f"result cache hit: {key}")
+        yield "done", {
+            "elapsed_time": 0.0,
+            "title": cached["outline"]["title"],
+            "full_text": cached["final_article"],
+            "paragraphs": cached["paragraphs"],
+            "cached": True,
+        }
+        return
+
+    app, graph_input, config = await _prepare(input_message, metadata, variant, run_id)
+    final_state = {}
+    running.add(run_id)
+    try:
+        with RunTimer() as timer, paragraph_prefetch(), (nullcontext() if use_cache else llm_cache_disabled()):
+            stream = app.astream(graph_input, config, stream_mode=["updates", "messages", "values"])
+            async for mode, chunk in stream:
+                if mode == "values":
+                    final_state = chunk
+                elif mode == "messages":
+                    message, message_metadata = chunk
+                    if message_metadata.get("langgraph_node") == "content_review_node" and message.content:
+                        yield "token", {"text": message.content}
+                else:
+                    for node, update in chunk.items():
+                        for event in _node_events(node, update or {}):
+                            yield event
+    except Exception as e:
+        e.run_id = run_id
+        raise
+    finally:
+        running.discard(run_id)
+    await checkpoints.compact(run_id)
+
+    deps = PIPELINE_DEPS[variant]
+    report = critical_path_report(timer, deps, outline_first(deps))
+    observe_run(variant, time.perf_counter() - timer.started)
+    logger.info(f"critical path: {report}")
+    if key:
+        result_cache.set(key, _cacheable(final_state))
+    yield "done", {
+        "elapsed_time": report.get("wall_time"),
+        "title": final_state["outline"]["title"],
+        "full_text": final_state["final_article"],
+        "paragraphs": final_state["paragraphs"],
+        "cached": False,
+    }
+
+async def run_status(run_id):
+    """Progress of a checkpointed run, or None if there is no such run."""
+    stored = await _stored_run(run_id)
+    if stored is None:
+        return None
+    variant, snapshot = stored
+    values = snapshot.values
+    # Siblings LangGraph cancelled because of the failure are not errors of their own
+    errors = [
+        {"node": task.name, "error": str(task.error)}
+        for task in snapshot.tasks if task.error and not str(task.error).startswith("CancelledError")
+    ]
+    if not snapshot.next:
+        status = "completed"
+    elif run_id in running:
+        status = "running"
+    else:
+        status = "failed" if errors else "interrupted"
+
+    sections = [child["node_id"] for child in values.get("outline", {}).get("children", [])]
+    written = {paragraph["node_id"] for paragraph in values.get("paragraphs", [])}
+    return {
+        "run_id": run_id,
+        "variant": variant,
+        "status": status,
+        "step": snapshot.metadata.get("step"),
+        "updated_at": snapshot.created_at,
+        "next": list(snapshot.next),
+        "errors": errors,
+        "progress": {
+            "outline": bool(values.get("outline")),
+            "preface": bool(values.get("preface")),
+            "insights": bool(values.get("insights")),
+            "paragraphs": {"written": len(written), "total": len(sections),
+                           "missing": [node_id for node_id in sections if node_id not in written]},
+            "final_article": bool(values.get("final_article")),
+        },
+    }
+
+# Example usage
+def run_workflow(input_message, metadata=None, variant="standard"):
+    async def run():
+        try:
+            return await arun_workflow(input_message, metadata, variant)
+        finally:
+            await checkpoints.close()
+    return asyncio.run(run())
+
+graph = pipelines.get("standard", llm1, llm2)
\ No newline at end of file
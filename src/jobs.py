@@ -0,0 +1,272 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("uvicorn")
+
+# Lanes in the order workers serve them
+LANES = ("high", "normal", "low")
+# Seconds between deletions of finished jobs older than the queue's ttl
+PRUNE_INTERVAL = float(os.environ.get("JOBS_PRUNE_INTERVAL", 3600))
+
+
+class QueueFull(Exception):
+    """The queue already holds its maximum number of waiting jobs."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry after {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """Jobs persisted in SQLite, so queued and interrupted work survives a restart.
+
+    A worker claims a job with a lease and renews it while the job runs. A job
+    whose lease lapses, because its process died, is claimed again by the next
+    free worker in any process sharing the file. A job that has been claimed
+    `max_attempts` times and whose lease lapses again is marked failed
+    instead, so a job that keeps killing its worker is not retried forever.
+    """
+
+    def __init__(self, path="jobs.sqlite", lease=60.0, max_attempts=3):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, lane INTEGER NOT NULL, status TEXT NOT NULL, request TEXT NOT NULL, "
+            "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, "
+            "started REAL, finished REAL, lease_until REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, lane, created)")
+
+    def add(self, lane, request):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, lane, status, request, created) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, LANES.index(lane), json.dumps(request, ensure_ascii=False), time.time()),
+            )
+        return job_id
+
+    def claim(self):
+        """Mark the next job running and return (id, request), or None if nothing is waiting."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished = ?, lease_until = NULL "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (
+                        json.dumps({"error": f"Lease lapsed after {self.max_attempts} attempts", "type": "LeaseExpired"}),
+                        now,
+                        now,
+                        self.max_attempts,
+                    ),
+                )
+                row = self._conn.execute(
+                    "SELECT id, request FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'running' AND lease_until < ?) ORDER BY lane, created LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', started = ?, lease_until = ?, attempts = attempts + 1 "
+                        "WHERE id = ?",
+                        (now, now + self.lease, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return (row["id"], json.loads(row["request"])) if row else None
+
+    def renew(self, job_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running'", (time.time() + self.lease, job_id)
+            )
+
+    def finish(self, job_id, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL WHERE id = ?",
+                (
+                    "failed" if error is not None else "succeeded",
+                    json.dumps(result, ensure_ascii=False) if result is not None else None,
+                    json.dumps(error, ensure_ascii=False) if error is not None else None,
+                    time.time(),
+                    job_id,
+                ),
+            )
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "lane": LANES[row["lane"]],
+            "attempts": row["attempts"],
+            "created_at": row["created"],
+            "started_at": row["started"],
+            "finished_at": row["finished"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": json.loads(row["error"]) if row["error"] else None,
+        }
+
+    def position(self, job_id):
+        """Number of queued jobs that will be served before this one."""
+        with self._lock:
+            row = self._conn.execute("SELECT lane, created FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (lane < ? OR (lane = ? AND created < ?))",
+                (row["lane"], row["lane"], row["created"]),
+            ).fetchone()[0]
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, lane, COUNT(*) FROM jobs GROUP BY status, lane").fetchall()
+        counts = {}
+        for status, lane, count in rows:
+            counts.setdefault(status, {})[LANES[lane]] = count
+        return counts
+
+    def queued(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def prune(self, older_than):
+        """Delete finished jobs that finished more than `older_than` seconds ago."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished < ?", (time.time() - older_than,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """A bounded pool of `workers` coroutines running `handler(job_id, request)` for stored jobs.
+
+    `workers` caps the pipelines in flight; `max_queued` caps the jobs waiting
+    for a worker, past which `submit` raises QueueFull with a Retry-After
+    estimate from recent job durations. Jobs that finished more than `ttl`
+    seconds ago are deleted at startup and then at most once per
+    `PRUNE_INTERVAL` by the workers.
+    """
+
+    def __init__(self, store, handler, workers=4, max_queued=1000, ttl=7 * 86400):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._tasks = []
+        self._wakeup = None
+        self._durations = []
+        self._pruned = 0.0
+
+    async def submit(self, request, lane="normal"):
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane: {lane}")
+        # Store calls wait on the lock the workers hold, so they run off the event loop
+        if await asyncio.to_thread(self.store.queued) >= self.max_queued:
+            raise QueueFull(self.retry_after())
+        job_id = await asyncio.to_thread(self.store.add, lane, request)
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up: one average job over the worker count."""
+        average = sum(self._durations) / len(self._durations) if self._durations else 60.0
+        return max(1, round(average / self.workers))
+
+    async def _renew(self, job_id):
+        while True:
+            await asyncio.sleep(self.store.lease / 3)
+            await asyncio.to_thread(self.store.renew, job_id)
+
+    async def _prune(self):
+        if time.time() - self._pruned > min(self.ttl, PRUNE_INTERVAL):
+            self._pruned = time.time()
+            await asyncio.to_thread(self.store.prune, self.ttl)
+
+    async def _work(self):
+        while True:
+            await self._prune()
+            claimed = await asyncio.to_thread(self.store.claim)
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    # Jobs added by other processes sharing the store are picked up on the next poll
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.store.lease / 3)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, request = claimed
+            start = time.perf_counter()
+            renewal = asyncio.ensure_future(self._renew(job_id))
+            try:
+                result = await self.handler(job_id, request)
+            except Exception as e:
+                logger.error(f"job {job_id} failed: {e}")
+                error = {"error": str(e), "type": type(e).__name__, "run_id": getattr(e, "run_id", None)}
+                await asyncio.to_thread(self.store.finish, job_id, error=error)
+            else:
+                await asyncio.to_thread(self.store.finish, job_id, result=result)
+            finally:
+                renewal.cancel()
+            self._durations = (self._durations + [time.perf_counter() - start])[-50:]
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers; jobs they were running stay claimed until their lease lapses."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    async def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "jobs": await asyncio.to_thread(self.store.counts),
+            "retry_after": self.retry_after(),
+        }
+
+
+def job_queue_from_env(handler):
+    return JobQueue(
+        JobStore(
+            os.environ.get("JOBS_PATH", "jobs.sqlite"),
+            lease=float(os.environ.get("JOBS_LEASE", 60)),
+            max_attempts=int(os.environ.get("JOBS_MAX_ATTEMPTS", 3)),
+        ),
+        handler,
+        workers=int(os.environ.get("JOBS_WORKERS", 4)),
+        max_queued=int(os.environ.get("JOBS_MAX_QUEUED", 1000)),
+        ttl=float(os.environ.get("JOBS_TTL", 7 * 86400)),
+    )
@@ -0,0 +1,123 @@
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from langchain_core.messages import AIMessage
+from .cache import cache_from_env, llm_cache_key
+from . import routing
+from .timing import llm_call
+from .utils import estimate_tokens, model_identity
+
+logger = logging.getLogger("uvicorn")
+
+# Per-call LLM responses keyed on the rendered prompt (LLM_CACHE=memory|sqlite|off)
+llm_cache = cache_from_env("LLM_CACHE", default_size=2048, table="llm_cache")
+
+
+class NodeCacheStats:
+    """Hit/miss counts of the LLM response cache, per graph node."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, node, hit):
+        with self._lock:
+            counts = self._counts.setdefault(node, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                node: {**counts, "hit_rate": round(counts["hits"] / (counts["hits"] + counts["misses"]), 4)}
+                for node, counts in self._counts.items()
+            }
+
+
+node_cache_stats = NodeCacheStats()
+
+_cache_enabled = ContextVar("llm_cache_enabled", default=True)
+
+
+@contextmanager
+def llm_cache_disabled():
+    """Skip the LLM response cache for calls made in this scope."""
+    token = _cache_enabled.set(False)
+    try:
+        yield
+    finally:
+        _cache_enabled.reset(token)
+
+
+def _lookup(model, messages, node, template):
+    if llm_cache is None or not _cache_enabled.get():
+        return None, None
+    key = llm_cache_key(model_identity(model), messages, template)
+    content = llm_cache.get(key)
+    node_cache_stats.record(node, content is not None)
+    if content is not None:
+        logger.info(f"LLM cache hit for {node}")
+    return key, content
+
+
+def _estimate_usage(call, messages, content):
+    """Fill in token counts the provider did not report."""
+    if not call.prompt_tokens:
+        call.prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+    if not call.completion_tokens:
+        call.completion_tokens = estimate_tokens(str(content))
+
+
+async def call_model(model, messages, node, template=None, options=None, accept=None):
+    """Invoke `model` on behalf of a graph node, reusing cached responses.
+
+    `template` names the prompt in `src/prompts.py` the messages were rendered
+    from; its version is part of the cache key. Calls that miss the cache go
+    through the model's router (`src/routing.py`), if it has one, and the
+    provider's scheduler (`src/ratelimit.py`). Every call is recorded by
+    `llm_call` (`src/timing.py`).
+
+    `options` maps the endpoint that serves the call to extra invoke
+    arguments (see `src/structured.py`). A response is cached only if
+    `accept`, when given, returns True for its content.
+    """
+    with llm_call(node) as call:
+        key, content = _lookup(model, messages, node, template)
+        if content is not None:
+            call.cached = True
+            return AIMessage(content=content)
+
+        response = await routing.invoke(model, messages, node, options)
+        _estimate_usage(call, messages, response.content)
+        if key and (accept is None or accept(response.content)):
+            llm_cache.set(key, response.content)
+        return response
+
+
+async def stream_model(model, messages, node, template=None, options=None, accept=None):
+    """Like `call_model`, but yields content chunks as they arrive.
+
+    The whole reply is cached once the stream ends, unless `accept` rejects it.
+    """
+    with llm_call(node) as call:
+        key, content = _lookup(model, messages, node, template)
+        if content is not None:
+            call.cached = True
+            yield content
+            return
+
+        parts = []
+        async for chunk in routing.stream(model, messages, node, options):
+            parts.append(chunk.content)
+            yield chunk.content
+        content = "".join(parts)
+        _estimate_usage(call, messages, content)
+        if key and (accept is None or accept(content)):
+            llm_cache.set(key, content)
+
+
+def cache_stats():
+    return {
+        "cache": llm_cache.stats() if llm_cache else None,
+        "nodes": node_cache_stats.as_dict(),
+    }
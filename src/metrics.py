@@ -0,0 +1,71 @@
+import json
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+
+# USD per million (prompt, completion) tokens. The longest key found in a model's name wins;
+# LLM_PRICES='{"model": [prompt, completion]}' adds or overrides entries.
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-v3": (0.27, 1.10),
+    "deepseek-r1": (0.55, 2.19),
+    **{name: tuple(price) for name, price in json.loads(os.environ.get("LLM_PRICES", "{}")).items()},
+}
+
+SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+NODE_DURATION = Histogram("wpa_node_duration_seconds", "Wall time of one node execution", ["node"], buckets=SECONDS)
+RUN_DURATION = Histogram("wpa_run_duration_seconds", "Wall time of one pipeline run", ["variant"], buckets=SECONDS)
+LLM_DURATION = Histogram(
+    "wpa_llm_call_duration_seconds", "LLM call time from admission to response", ["node", "model"], buckets=SECONDS
+)
+LLM_QUEUE_WAIT = Histogram("wpa_llm_queue_wait_seconds", "Time an LLM call waited for its provider", ["node"], buckets=SECONDS)
+LLM_TTFT = Histogram(
+    "wpa_llm_time_to_first_token_seconds", "Time to the first streamed token, from admission", ["node", "model"], buckets=SECONDS
+)
+LLM_CALLS = Counter("wpa_llm_calls_total", "LLM calls by outcome (ok, cached, error)", ["node", "outcome"])
+LLM_TOKENS = Counter("wpa_llm_tokens_total", "LLM tokens by kind (prompt, completion)", ["node", "model", "kind"])
+LLM_COST = Counter("wpa_llm_cost_usd_total", "Estimated LLM cost in USD", ["node", "model"])
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """Estimated USD cost of a call, or None for a model without a known price."""
+    matches = [name for name in PRICES if name in (model or "").lower()]
+    if not matches:
+        return None
+    prompt_price, completion_price = PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+def observe_node(node, duration):
+    NODE_DURATION.labels(node).observe(duration)
+
+
+def observe_run(variant, duration):
+    RUN_DURATION.labels(variant).observe(duration)
+
+
+def observe_call(call):
+    """Export one finished LLMCall (`src/timing.py`)."""
+    if call.cached:
+        LLM_CALLS.labels(call.node, "cached").inc()
+        return
+    LLM_CALLS.labels(call.node, "error" if call.error else "ok").inc()
+    if call.queue_wait is not None:
+        LLM_QUEUE_WAIT.labels(call.node).observe(call.queue_wait)
+    if call.error:
+        return
+    model = call.model or "unknown"
+    LLM_DURATION.labels(call.node, model).observe(call.duration)
+    if call.ttft is not None:
+        LLM_TTFT.labels(call.node, model).observe(call.ttft)
+    LLM_TOKENS.labels(call.node, model, "prompt").inc(call.prompt_tokens)
+    LLM_TOKENS.labels(call.node, model, "completion").inc(call.completion_tokens)
+    if call.cost is not None:
+        LLM_COST.labels(call.node, model).inc(call.cost)
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition for this process."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,55 +1,66 @@
 from langgraph.types import Send
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+import asyncio
 import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
 import logging
-from .prompts import OUTLINE_PROMPT, CONTENT_REVIEW_PROMPT, PARAGRAPH_PROMPT, INSIGHTS_PROMPT, TRANSCRIPT_PROMPT, FACT_CHECKER_PROMPT, SUMMARIZE_PROMPT, PREFACE_PROMPT, IMPROVE_TITLE_PROMPT, generate_final_article
-from .utils import remove_json_markers
+from .prompts import OUTLINE_PROMPT, CONTENT_REVIEW_PROMPT, CONTENT_EDITS_PROMPT, SECTION_REVIEW_PROMPT, PARAGRAPH_PROMPT, INSIGHTS_PROMPT, TRANSCRIPT_PROMPT, FACT_CHECKER_PROMPT, SUMMARIZE_PROMPT, PREFACE_PROMPT, IMPROVE_TITLE_PROMPT, generate_final_article
+from .utils import ChildrenStreamParser
+from .timing import timed
+from .llm import call_model, stream_model
+from .retrieval import ArticleContext
+from .preprocess import condensed_source
+from .review import find_repetitions, format_hints
+from .edits import EditError, render_sections, parse_edits, apply_edits, edit_review_stats
 from .state import State, ParagraphState
-from .web_search import enrich_content
+from .web_search import enrich_sections
+from .json_schema import json_schema
+from .deadline import cap_sections, deadline_bound
+from .structured import StructuredOutputError, accepts, call_structured, ensure_structured, response_format
 from json.decoder import JSONDecodeError  # Add this import at the top
 
 logger = logging.getLogger("uvicorn")
 # print = logger.info
 
-def preface_writer(state: State, model):
+async def preface_writer(state: State, model):
     print("writing preface")
     print("------------------")
 
     prompt = HumanMessage(content=PREFACE_PROMPT.format(
         metadata=state['metadata']
     ))
-    response = model.invoke([prompt])
+    response = await call_model(model, [prompt], node="preface_node", template="PREFACE_PROMPT")
     
     return {
         "preface": response.content,
         "messages": [AIMessage(content=response.content)]
     }
-def improve_title_writer(state: State, model):
+async def improve_title_writer(state: State, model):
     logger.info("writing better titles")
     logger.info("------------------")
 
     prompt = HumanMessage(content=IMPROVE_TITLE_PROMPT.format(
         outline=state['outline']
     ))
-    response = model.invoke([prompt])
-    
-    formatted_response = remove_json_markers(response.content)
-    formatted_response = json.loads(formatted_response)
+    formatted_response = await call_structured(model, [prompt], node="improve_title_node", schema=json_schema(),
+                                               template="IMPROVE_TITLE_PROMPT")
     logger.info(f"improved titles: {formatted_response}")
     
     return {
         "outline": formatted_response,
-        "messages": [AIMessage(content=response.content)]
+        "messages": [AIMessage(content=json.dumps(formatted_response, ensure_ascii=False))]
     }
 
-def summarize_writer(state: State, model):
+async def summarize_writer(state: State, model):
     print("summarizing article")
     print("------------------")
 
     prompt = HumanMessage(content=SUMMARIZE_PROMPT(
         original_article=state['original_article']
     ))
-    response = model.invoke([prompt])
+    response = await call_model(model, [prompt], node="summarize_node", template="SUMMARIZE_PROMPT")
     
     return {
         "original_article": response.content,
@@ -66,63 +77,149 @@ def select_next(state: State):
 
     return "next_paragraph"
 
-def outline_writer(state: State, model):
+async def outline_writer(state: State, model):
     try:
         print("writing outline")
         print("------------------")
 
+        source, preprocessing = await condensed_source(state['original_article'], model)
         prompt = HumanMessage(content=OUTLINE_PROMPT(
-            original_article={state['original_article']}
+            original_article={source}
         ))
-        response = model.invoke([prompt])
-        
-        formatted_response = remove_json_markers(response.content)
-        formatted_response = json.loads(formatted_response)
+        formatted_response = await call_structured(model, [prompt], node="outline_node", schema=json_schema(),
+                                                   template="OUTLINE_PROMPT")
+        formatted_response = cap_sections(formatted_response)
         logger.info(formatted_response)
 
         return {
             "outline": formatted_response,
-            "messages": [AIMessage(content=response.content)]
+            "preprocessing": preprocessing or {},
+            "messages": [AIMessage(content=json.dumps(formatted_response, ensure_ascii=False))]
         }
-    except JSONDecodeError as e:
-        error_msg = f"JSON decode error in outline: {str(e)}. Raw response: {response.content if 'response' in locals() else 'N/A'}"
-        logger.error(error_msg)
-        raise JSONDecodeError(f"{error_msg}. Original error: {str(e)}", e.doc, e.pos)
+    except StructuredOutputError as e:
+        logger.error(f"Invalid outline: {str(e)}")
+        raise
     except Exception as e:
         error_msg = f"Error in outline_writer: {str(e)}. State: {state}"
         logger.error(error_msg)
         raise Exception(error_msg)
 
-def web_search_writer(state: State):
+_prefetched_paragraphs = ContextVar("prefetched_paragraphs", default=None)
+
+@contextmanager
+def paragraph_prefetch():
+    """Scope in which streaming_outline_writer may start paragraphs early for one run."""
+    pending = {}
+    token = _prefetched_paragraphs.set(pending)
+    try:
+        yield pending
+    finally:
+        _prefetched_paragraphs.reset(token)
+        for task in pending.values():
+            task.cancel()
+
+def _paragraph_task(model):
+    """paragraph_node as the graph runs it: timed, and cut off at the run's deadline with paragraph_fallback."""
+    return timed("paragraph_node", deadline_bound("paragraph_node", partial(paragraph_writer, model=model),
+                                                  fallback=paragraph_fallback))
+
+async def streaming_outline_writer(state: State, model):
+    """Stream the outline and start a paragraph writer as soon as each section is parsed.
+
+    LangGraph only dispatches `Send`s after a node returns, so sections are
+    started here as background tasks and picked up by collect_paragraphs_writer.
+    Outside a `paragraph_prefetch()` scope this behaves like outline_writer.
+    """
+    print("writing outline (streaming)")
+    print("------------------")
+
+    source, preprocessing = await condensed_source(state['original_article'], model)
+    prompt = HumanMessage(content=OUTLINE_PROMPT(
+        original_article={source}
+    ))
+    pending = _prefetched_paragraphs.get()
+    write_paragraph = _paragraph_task(model)
+    context = ArticleContext(state["original_article"]) if pending is not None else None
+    parser = ChildrenStreamParser()
+    content = ""
+
+    try:
+        async for text in stream_model(model, [prompt], node="outline_node", template="OUTLINE_PROMPT",
+                                       options=partial(response_format, schema=json_schema()),
+                                       accept=accepts(json_schema())):
+            content += text
+            for child in parser.feed(text):
+                if pending is not None and child.get("node_id") is not None and child["node_id"] not in pending:
+                    logger.info(f"Dispatching paragraph while outline streams: {child['node_id']}")
+                    pending[child["node_id"]] = asyncio.create_task(write_paragraph({
+                        "original_article": context.for_node(child),
+                        "node": child
+                    }))
+
+        formatted_response = cap_sections(await ensure_structured(model, [prompt], content, "outline_node", json_schema()))
+        logger.info(formatted_response)
+
+        return {
+            "outline": formatted_response,
+            "preprocessing": preprocessing or {},
+            "messages": [AIMessage(content=content)]
+        }
+    except StructuredOutputError as e:
+        logger.error(f"Invalid outline: {str(e)}. Raw response: {content}")
+        raise
+
+async def collect_paragraphs_writer(state: State, model):
+    """Await paragraphs started while the outline streamed and write any that are missing."""
+    pending = _prefetched_paragraphs.get() or {}
+    children = {child["node_id"]: child for child in state["outline"]["children"]}
+
+    # The complete outline is authoritative; drop sections that did not survive into it
+    for node_id in list(pending):
+        if node_id not in children:
+            pending.pop(node_id).cancel()
+
+    write_paragraph = _paragraph_task(model)
+    context = ArticleContext(state["original_article"]) if len(pending) < len(children) else None
+    results = await asyncio.gather(*(
+        pending.pop(node_id) if node_id in pending else write_paragraph({
+            "original_article": context.for_node(child),
+            "node": child
+        })
+        for node_id, child in children.items()
+    ))
+
+    return {
+        "paragraphs": [p for result in results for p in result["paragraphs"]],
+        "messages": [m for result in results for m in result.get("messages", [])]
+    }
+
+async def web_search_writer(state: State):
+    """Search the web once per outline section, in parallel, for context its paragraph can use."""
     print("enriching content with web search")
     print("------------------")
-    
-    # Use original article as search query if outline title is not available
-    search_query = state['original_article'][:200]  # Use first 200 chars of original article
-    
-    # Search for relevant content
-    enriched_content = enrich_content(search_query)
-    
-    # Add the enriched content to the original article
-    enhanced_article = state['original_article'] + "\n\nAdditional Background Information:\n"
-    print("enriched: ---- \n", enriched_content)
-    
+
+    web_context = await enrich_sections(state["outline"])
+    logger.info(f"web context for {len(web_context)}/{len(state['outline'].get('children', []))} sections")
+
     return {
-        "original_article": enhanced_article,
-        "messages": [HumanMessage(content=str(enriched_content))]
+        "web_context": web_context,
+        "messages": [HumanMessage(content=json.dumps(web_context, ensure_ascii=False))]
     }
-    
-def paragraph_writer(state: ParagraphState, model):
+
+async def paragraph_writer(state: ParagraphState, model):
     try:
         node = state['node']
         logger.info(f"Writing paragraph: {node['node_id']}")
 
+        source = state['original_article']
+        if state.get('web_context'):
+            source += "\n\nAdditional Background Information:\n" + state['web_context']
         new_message = HumanMessage(content=PARAGRAPH_PROMPT.format(
-            original_article=state['original_article'],
+            original_article=source,
             node=node
         ))
 
-        response = model.invoke([new_message])
+        response = await call_model(model, [new_message], node="paragraph_node", template="PARAGRAPH_PROMPT")
 
         new_node = {
             "node_id": node['node_id'],
@@ -150,9 +247,24 @@ def paragraph_writer(state: ParagraphState, model):
         logger.error(error_msg)
         raise Exception(error_msg)
 
+def paragraph_fallback(state: ParagraphState):
+    """A section cut off by the run's deadline: its outline summary stands in for the paragraph."""
+    node = state["node"]
+    return {"paragraphs": [{"node_id": node["node_id"], "title": node["title"], "full_text": node.get("content", "")}]}
+
 def continue_to_paragraphs(state: State) -> list[Send]:
-    """Generate Send objects for each subject to be processed in parallel."""
-    return [Send("paragraph_node", {"original_article": state["original_article"], "node": s}) for s in state["outline"]["children"]]
+    """Generate Send objects for each subject to be processed in parallel.
+
+    Each Send carries only the source excerpt relevant to its outline node,
+    and the web search results for that node when there are any.
+    """
+    context = ArticleContext(state["original_article"])
+    web_context = state.get("web_context") or {}
+    return [
+        Send("paragraph_node", {"original_article": context.for_node(s), "node": s,
+                                "web_context": web_context.get(s["node_id"], "")})
+        for s in state["outline"]["children"]
+    ]
 
 def final_writer(state: State):
     print("FINAL --------------")
@@ -184,32 +296,33 @@ def final_writer(state: State):
         )
     }
 
-def insights_writer(state: State, model):
+async def insights_writer(state: State, model):
     print("writing top insights")
     print("------------------")
+    source, _ = await condensed_source(state['original_article'], model)
     new_message = HumanMessage(content=INSIGHTS_PROMPT.format(
-        original_article=state['original_article']
+        original_article=source
     ))
-    response = model.invoke([new_message])
+    response = await call_model(model, [new_message], node="insights_node", template="INSIGHTS_PROMPT")
     return {
         "insights": response.content,
         "messages": [AIMessage(content=response.content)]
     }
 
-def transcript_writer(state: State, model):
+async def transcript_writer(state: State, model):
     new_message = HumanMessage(content=TRANSCRIPT_PROMPT.format(
         original_article=state['original_article'],
         outline=state['outline']
     ))
 
-    response = model.invoke([new_message])
+    response = await call_model(model, [new_message], node="transcript_node", template="TRANSCRIPT_PROMPT")
 
     return {
         "transcript": response.content,
         "messages": [AIMessage(content=response.content)]
     }
 
-def content_review_writer(state: State, model):
+async def content_review_writer(state: State, model):
     print("reviewing content for redundancy")
     print("------------------")
     
@@ -218,7 +331,7 @@ def content_review_writer(state: State, model):
         new_message = HumanMessage(content=CONTENT_REVIEW_PROMPT.format(
             article=state['final_article']
         ))
-        response = model.invoke([new_message])
+        response = await call_model(model, [new_message], node="content_review_node", template="CONTENT_REVIEW_PROMPT")
 
         return {
             "final_article": response.content,
@@ -230,14 +343,69 @@ def content_review_writer(state: State, model):
         logger.error(f"{e.msg}")
         raise JSONDecodeError(f"{error_msg}. Original error: {str(e)}", e.doc, e.pos)
 
-def fact_checker(state: State, model):
+async def edit_review_writer(state: State, model):
+    """Review the article as an edit script over its sections instead of a full rewrite.
+
+    Falls back to content_review_writer when the script cannot be parsed or
+    its anchors do not match the sections.
+    """
+    print("reviewing content as edits")
+    print("------------------")
+
+    new_message = HumanMessage(content=CONTENT_EDITS_PROMPT.format(
+        sections=render_sections(state['paragraphs'])
+    ))
+    response = await call_model(model, [new_message], node="edit_review_node", template="CONTENT_EDITS_PROMPT")
+    try:
+        edits = parse_edits(response.content)
+        paragraphs = apply_edits(state['paragraphs'], edits)
+    except EditError as e:
+        logger.warning(f"edit script rejected, falling back to a full rewrite: {e}")
+        edit_review_stats.record(response.content, state['final_article'])
+        return await content_review_writer(state, model)
+
+    edit_review_stats.record(response.content, state['final_article'], edits)
+    logger.info(f"applied {len(edits)} edits: {edits}")
+    return {
+        **final_writer({**state, "paragraphs": paragraphs}),
+        "paragraphs": paragraphs,
+        "messages": [AIMessage(content=response.content)]
+    }
+
+async def section_review_writer(state: State, model):
+    """Review every section in parallel, guided by repetition found locally across sections."""
+    print("reviewing sections for redundancy")
+    print("------------------")
+
+    paragraphs = state['paragraphs']
+    hints = find_repetitions(paragraphs)
+    titles = {p['node_id']: p['title'] for p in paragraphs}
+    logger.info(f"cross-section repetition: {hints}")
+
+    async def review(paragraph):
+        new_message = HumanMessage(content=SECTION_REVIEW_PROMPT.format(
+            title=paragraph['title'],
+            hints=format_hints(hints.get(paragraph['node_id'], []), titles),
+            section=paragraph['full_text']
+        ))
+        response = await call_model(model, [new_message], node="section_review_node", template="SECTION_REVIEW_PROMPT")
+        return {**paragraph, "full_text": response.content}, AIMessage(content=response.content)
+
+    results = await asyncio.gather(*(review(p) for p in paragraphs))
+    return {
+        "paragraphs": [paragraph for paragraph, _ in results],
+        "messages": [message for _, message in results]
+    }
+
+async def fact_checker(state: State, model):
     new_message = HumanMessage(content=FACT_CHECKER_PROMPT.format(
         original_article=state['original_article'],
         final_article=state['final_article']
     ))
 
-    response = model.invoke([new_message])
+    response = await call_model(model, [new_message], node="fact_checker", template="FACT_CHECKER_PROMPT")
     print("Score: " + response.content)
     return {
+        "fact_check": response.content,
         "messages": [AIMessage(content=response.content)]
     }
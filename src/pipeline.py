@@ -0,0 +1,117 @@
+import inspect
+from dataclasses import dataclass
+from functools import partial, wraps
+from typing import Callable, Optional
+from langgraph.graph import StateGraph, START, END
+from .state import State
+from .timing import timed
+from .deadline import deadline_bound
+
+
+@dataclass(frozen=True)
+class NodeSpec:
+    """A graph node and the state fields it reads and writes.
+
+    `model` names the LLM role ("llm1", "llm2") bound at build time, and
+    `fan_out` is a router returning `Send` objects that dispatch this node
+    once per item instead of wiring it with a plain edge. Under a deadline
+    (`src/deadline.py`), an `optional` node may be skipped or cut short, and
+    a node with a `fallback` is cut short and returns `fallback(state)`.
+    """
+    name: str
+    func: Callable
+    reads: tuple = ()
+    writes: tuple = ()
+    model: Optional[str] = None
+    fan_out: Optional[Callable] = None
+    optional: bool = False
+    fallback: Optional[Callable] = None
+
+
+def resolve_dependencies(specs):
+    """Map each node to the minimal set of nodes it has to wait for.
+
+    A read resolves to the latest earlier spec that writes that field; fields
+    nobody writes are run inputs, so nodes reading only inputs start at START.
+    Dependencies already implied by another dependency are dropped.
+    """
+    deps = {}
+    last_writer = {}
+    for spec in specs:
+        direct = {last_writer[field] for field in spec.reads if field in last_writer}
+        implied = set()
+        for dep in direct:
+            implied |= _ancestors(dep, deps)
+        deps[spec.name] = [name for name in deps if name in direct - implied]
+        for field in spec.writes:
+            last_writer[field] = spec.name
+    return deps
+
+
+def _ancestors(name, deps):
+    seen = set()
+    stack = list(deps.get(name, []))
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            stack.extend(deps.get(node, []))
+    return seen
+
+
+def without_messages(func):
+    """Drop the `messages` a node returns, so LLM responses are not accumulated in the state."""
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(state):
+            update = await func(state)
+            if isinstance(update, dict):
+                update.pop("messages", None)
+            return update
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(state):
+        update = func(state)
+        if isinstance(update, dict):
+            update.pop("messages", None)
+        return update
+    return wrapper
+
+
+def build_graph(specs, models, checkpointer=None, lean_state=False):
+    """Compile a StateGraph wired purely from the specs' data dependencies.
+
+    With `lean_state`, nodes' `messages` updates are dropped before they reach
+    the graph: nothing reads them, and every response they hold would
+    otherwise stay in the run's state, its checkpoints and its pending writes
+    until the run ends.
+    """
+    workflow = StateGraph(State)
+    deps = resolve_dependencies(specs)
+
+    for spec in specs:
+        func = partial(spec.func, model=models[spec.model]) if spec.model else spec.func
+        if spec.optional or spec.fallback:
+            func = deadline_bound(spec.name, func, optional=spec.optional, fallback=spec.fallback)
+        if lean_state:
+            func = without_messages(func)
+        workflow.add_node(spec.name, timed(spec.name, func))
+
+    for spec in specs:
+        parents = deps[spec.name]
+        if spec.fan_out:
+            if len(parents) != 1:
+                raise ValueError(f"Fan-out node {spec.name} must depend on exactly one node, got {parents}")
+            workflow.add_conditional_edges(parents[0], spec.fan_out, [spec.name])
+        elif not parents:
+            workflow.add_edge(START, spec.name)
+        else:
+            workflow.add_edge(parents if len(parents) > 1 else parents[0], spec.name)
+
+    needed = {dep for parents in deps.values() for dep in parents}
+    for spec in specs:
+        if spec.name not in needed:
+            workflow.add_edge(spec.name, END)
+
+    return workflow.compile(checkpointer=checkpointer)
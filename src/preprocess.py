@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from langchain_core.messages import HumanMessage
+from .llm import call_model
+from .prompts import SUMMARIZE_PROMPT
+from .retrieval import split_chunks
+from .singleflight import SingleFlight
+from .timing import current_timer
+from .utils import estimate_tokens
+
+logger = logging.getLogger("uvicorn")
+
+# Sources above this size are condensed before the outline and insights are written
+PREPROCESS_THRESHOLD_TOKENS = int(os.environ.get("PREPROCESS_THRESHOLD_TOKENS", 24000))
+PREPROCESS_TARGET_TOKENS = int(os.environ.get("PREPROCESS_TARGET_TOKENS", 12000))
+PREPROCESS_CHUNK_TOKENS = int(os.environ.get("PREPROCESS_CHUNK_TOKENS", 6000))
+PREPROCESS_CONCURRENCY = int(os.environ.get("PREPROCESS_CONCURRENCY", 4))
+PREPROCESS_MAX_LEVELS = 4
+
+
+async def map_reduce_summarize(text, model, target_tokens=PREPROCESS_TARGET_TOKENS,
+                               chunk_tokens=PREPROCESS_CHUNK_TOKENS, concurrency=PREPROCESS_CONCURRENCY):
+    """Summarize token-budgeted chunks in parallel, then repeat on the joined summaries until they fit.
+
+    Returns the condensed text and one timing record per level.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    levels = []
+
+    async def summarize(chunk):
+        async with semaphore:
+            prompt = HumanMessage(content=SUMMARIZE_PROMPT(original_article=chunk))
+            response = await call_model(model, [prompt], node="summarize_node", template="SUMMARIZE_PROMPT")
+            return response.content
+
+    while estimate_tokens(text) > target_tokens and len(levels) < PREPROCESS_MAX_LEVELS:
+        start = time.perf_counter()
+        chunks = split_chunks(text, chunk_tokens)
+        summaries = await asyncio.gather(*(summarize(chunk) for chunk in chunks))
+        condensed = "\n\n".join(summaries)
+
+        level = {
+            "level": len(levels) + 1,
+            "chunks": len(chunks),
+            "input_tokens": estimate_tokens(text),
+            "output_tokens": estimate_tokens(condensed),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        levels.append(level)
+        logger.info(f"map-reduce level {level['level']}: {level}")
+
+        if level["output_tokens"] >= level["input_tokens"]:
+            # Summaries are not shrinking the text; stop rather than loop
+            break
+        text = condensed
+
+    return text, levels
+
+
+_condensing = SingleFlight()
+
+
+async def _condense(article, model):
+    start = time.perf_counter()
+    try:
+        return await map_reduce_summarize(article, model)
+    finally:
+        timer = current_timer()
+        if timer:
+            timer.record("summarize_node", start, time.perf_counter())
+
+
+async def condensed_source(article, model):
+    """Source text for whole-article prompts, and the preprocessing report if it was condensed.
+
+    Sources above PREPROCESS_THRESHOLD_TOKENS are condensed with
+    map_reduce_summarize. The nodes that need it (outline and insights) start
+    together, so they share one summary rather than adding a graph step that
+    every run would wait on; the first caller's model does the work.
+    """
+    tokens = estimate_tokens(article)
+    if tokens <= PREPROCESS_THRESHOLD_TOKENS:
+        return article, None
+
+    key = hashlib.sha256(article.encode("utf-8")).hexdigest()
+    condensed, levels = await _condensing.do(key, lambda: _condense(article, model))
+    return condensed, {"input_tokens": tokens, "output_tokens": estimate_tokens(condensed), "levels": levels}
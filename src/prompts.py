@@ -1,3 +1,5 @@
+import hashlib
+import inspect
 from .json_schema import json_schema
 
 PREFACE_PROMPT = """
@@ -23,6 +25,11 @@ IMPROVE_TITLE_PROMPT = """
 以上是一篇微信公众号文章的大纲（json 格式），请改善所有的标题和小标题，使其变得更加锐利、更有吸引力。only reply in the same json schema, and do not lead with ```json``` or linebreaks
 """
 
+STRUCTURED_REPAIR_PROMPT = """
+Your previous reply could not be used: {error}
+Reply again with only the corrected JSON, following the same schema, with no code fences or text around it.
+"""
+
 CONTENT_REVIEW_PROMPT="""
         <role>公众号写手</role>  
         <instruction>通读整篇文章，检查是否存在内容重复或过度使用的短语。删除或精简重复表达同一观点的段落或部。检查并删除频繁出现的短语或句式（例如“试想一下……”“想象一下...”）。删除或减少第二人称的问句。
@@ -33,6 +40,33 @@ CONTENT_REVIEW_PROMPT="""
         </article>
     """
 
+CONTENT_EDITS_PROMPT="""
+        <role>公众号写手</role>
+        <instruction>通读整篇文章，检查是否存在内容重复或过度使用的短语。删除或精简重复表达同一观点的句子。检查并删除频繁出现的短语或句式（例如“试想一下……”“想象一下...”）。删除或减少第二人称的问句。
+        不要输出修改后的文章，只输出修改列表（JSON 数组），每一项是以下两种之一：
+        {{"op": "delete", "id": "小节 id", "text": "要删除的原文"}}
+        {{"op": "replace", "id": "小节 id", "text": "要替换的原文", "with": "替换后的文字"}}
+        "text" 必须逐字复制自对应 id 小节的原文，尽量短，但在该小节中唯一。没有需要修改的地方时输出 []。不要包含```，不要输出任何解释。
+        </instruction>
+        <article>
+        {sections}
+        </article>
+    """
+
+SECTION_REVIEW_PROMPT="""
+        <role>公众号写手</role>
+        <instruction>下面是一篇文章中的一个小节《{title}》。检查是否存在内容重复或过度使用的短语，删除或精简重复表达同一观点的句子。检查并删除频繁出现的短语或句式（例如“试想一下……”“想象一下...”）。删除或减少第二人称的问句。
+        <repetition> 中列出了本小节与文章其他小节重复的短语，请在本小节中删除或改写它们，除非删除后语义不完整。
+        直接在我提供的小节上修改，而不是仅仅提供建议。不要包含```，不要输出小节标题，直接输出你修改后的完整小节正文。
+        </instruction>
+        <repetition>
+        {hints}
+        </repetition>
+        <section>
+        {section}
+        </section>
+    """
+
 def SUMMARIZE_PROMPT(original_article):
     base_prompt = """
         <role>
@@ -204,4 +238,29 @@ FACT_CHECKER_PROMPT = """
     Your job is to check if a final article is 100% factually supported by source material.
     Check for names, date, ideas, special nouns, opinions. Check which person expressed which ideas. Give a factual score out of 100.
     </instructions>
-    """
\ No newline at end of file
+    """
+
+def prompt_versions():
+    """Short content hash of every prompt template, keyed by template name.
+
+    Anything cached from LLM output should include the relevant versions in its
+    key, so editing a template here invalidates the entries built from it.
+    """
+    templates = {
+        "PREFACE_PROMPT": PREFACE_PROMPT,
+        "IMPROVE_TITLE_PROMPT": IMPROVE_TITLE_PROMPT,
+        "STRUCTURED_REPAIR_PROMPT": STRUCTURED_REPAIR_PROMPT,
+        "CONTENT_REVIEW_PROMPT": CONTENT_REVIEW_PROMPT,
+        "CONTENT_EDITS_PROMPT": CONTENT_EDITS_PROMPT,
+        "SECTION_REVIEW_PROMPT": SECTION_REVIEW_PROMPT,
+        "SUMMARIZE_PROMPT": SUMMARIZE_PROMPT("{original_article}"),
+        "OUTLINE_PROMPT": OUTLINE_PROMPT("{original_article}"),
+        "PARAGRAPH_PROMPT": PARAGRAPH_PROMPT,
+        "INSIGHTS_PROMPT": INSIGHTS_PROMPT,
+        "TRANSCRIPT_PROMPT": TRANSCRIPT_PROMPT,
+        "FACT_CHECKER_PROMPT": FACT_CHECKER_PROMPT,
+        "generate_final_article": inspect.getsource(generate_final_article),
+    }
+    return {name: hashlib.sha256(text.encode("utf-8")).hexdigest()[:12] for name, text in templates.items()}
+
+PROMPT_VERSIONS = prompt_versions()
@@ -0,0 +1,376 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+import openai
+from .timing import call_admitted, call_first_token, call_served
+from .utils import estimate_tokens
+
+# Lower runs first. Stages that finish an in-flight article outrank those that start a new one,
+# so tail calls like content review are never queued behind the next article's fan-out.
+NODE_PRIORITY = {
+    "content_review_node": 0,
+    "edit_review_node": 0,
+    "section_review_node": 0,
+    "improve_title_node": 1,
+    "paragraph_node": 1,
+    "preface_node": 2,
+    "insights_node": 2,
+    "transcript_node": 2,
+    "fact_checker": 2,
+    "outline_node": 3,
+    "summarize_node": 3,
+}
+DEFAULT_PRIORITY = 2
+
+# A waiter gains one priority level per this many seconds queued, so low priorities cannot starve
+AGING_SECONDS = 30.0
+RETRIES = int(os.environ.get("RATE_LIMIT_RETRIES", 3))
+
+
+def provider_name(model):
+    """Short provider name from a model's endpoint: "openai", "openrouter", "127_0_0_1_8100"."""
+    base_url = getattr(model, "openai_api_base", None) or "https://api.openai.com/v1"
+    host = urlparse(base_url).netloc or base_url
+    hostname = host.split(":")[0]
+    if hostname == "localhost" or hostname.replace(".", "").isdigit():
+        return host.replace(".", "_").replace(":", "_")
+    labels = hostname.split(".")
+    return labels[-2] if len(labels) > 1 else labels[0]
+
+
+def model_label(model):
+    """Provider and model name, as reported in call timings and /metrics: "openrouter/deepseek/deepseek-chat"."""
+    return f"{provider_name(model)}/{getattr(model, 'model_name', None) or getattr(model, 'model', None)}"
+
+
+def is_rate_limited(error):
+    return getattr(error, "status_code", None) == 429
+
+
+def is_transient(error):
+    """Errors worth retrying: throttling, server errors and dropped connections."""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def retry_after(error, attempt):
+    """Seconds to wait before retrying a throttled call: the server's Retry-After, else backoff."""
+    response = getattr(error, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(header)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 30)
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (amounts above capacity wait for a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount):
+        """Remove `amount` units; the level may go negative to settle a call that used more than estimated."""
+        self._refill()
+        self.level -= amount
+
+
+class _Waiter:
+    def __init__(self, priority, seq, tokens, future):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+    def rank(self, now):
+        return (self.priority - (now - self.enqueued) / AGING_SECONDS, self.seq)
+
+
+class SchedulerStats:
+    def __init__(self):
+        self.calls = 0
+        self.throttled = 0
+        self.decreases = 0
+        self.max_queue_depth = 0
+        self.waits = deque(maxlen=1000)
+
+    def as_dict(self):
+        waits = sorted(self.waits)
+
+        def pct(p):
+            return round(waits[min(int(p * len(waits)), len(waits) - 1)], 4) if waits else 0.0
+
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "window_decreases": self.decreases,
+            "max_queue_depth": self.max_queue_depth,
+            "wait_p50": pct(0.5),
+            "wait_p95": pct(0.95),
+            "wait_max": round(waits[-1], 4) if waits else 0.0,
+        }
+
+
+class ProviderScheduler:
+    """Admission control for one provider, shared by every run in the process.
+
+    Calls queue by priority and are admitted while fewer than `window` are in
+    flight and the request and token buckets allow. The window follows AIMD:
+    it grows with each success (doubling per round trip until the first sign
+    of congestion, then by one per round trip) and halves, at most once per
+    typical call latency, when a call is throttled or when recent calls for a
+    node average `latency_factor` times their long-run latency.
+    """
+
+    def __init__(self, name, rpm=0, tpm=0, max_concurrency=512, initial_concurrency=16, latency_factor=3.0):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.window = float(min(initial_concurrency, max_concurrency))
+        self.threshold = float(max_concurrency)
+        self.latency_factor = latency_factor
+        self.active = 0
+        self.stats = SchedulerStats()
+        self._queue = []
+        self._seq = itertools.count()
+        self._latency = {}
+        self._last_decrease = 0.0
+        self._timer = None
+
+    async def _acquire(self, priority, tokens):
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._seq), tokens, loop.create_future())
+        self._queue.append(waiter)
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, len(self._queue))
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                self._release()
+            raise
+        self.stats.waits.append(time.monotonic() - waiter.enqueued)
+
+    def _dispatch(self):
+        self._timer = None
+        while self._queue and self.active < int(self.window):
+            now = time.monotonic()
+            waiter = min(self._queue, key=lambda w: w.rank(now))
+            if waiter.future.done():
+                # Cancelled while queued; its task removes it too, but must not block the queue meanwhile
+                self._queue.remove(waiter)
+                continue
+            # The best-ranked waiter holds the buckets, so lower priorities cannot slip past it
+            delay = max(
+                self.requests.wait_time(1) if self.requests else 0.0,
+                self.tokens.wait_time(waiter.tokens) if self.tokens else 0.0,
+            )
+            if delay > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            self._queue.remove(waiter)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(waiter.tokens)
+            self.active += 1
+            waiter.future.set_result(None)
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _on_success(self, node, latency):
+        # A fast and a slow moving average per node: single slow calls barely move the fast one,
+        # a provider that is slowing down overall pulls it well above the slow one
+        fast, slow = self._latency.get(node, (latency, latency))
+        fast, slow = 0.9 * fast + 0.1 * latency, 0.98 * slow + 0.02 * latency
+        self._latency[node] = (fast, slow)
+        if fast > self.latency_factor * slow:
+            self._decrease(slow)
+        elif self.window < self.threshold:
+            self.window = min(self.window + 1, self.max_concurrency)
+        else:
+            self.window = min(self.window + 1 / self.window, self.max_concurrency)
+
+    def _on_throttle(self, node):
+        self.stats.throttled += 1
+        self._decrease(self._latency.get(node, (1.0, 1.0))[1])
+
+    def _decrease(self, cooldown):
+        now = time.monotonic()
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.window = max(self.window / 2, 1.0)
+        self.threshold = self.window
+        self.stats.decreases += 1
+
+    @asynccontextmanager
+    async def slot(self, node, prompt_tokens):
+        """Hold one admission for a call from `node` expected to use `prompt_tokens`.
+
+        Yields a function to report the call's actual token usage, which
+        settles the token bucket against the estimate.
+        """
+        await self._acquire(NODE_PRIORITY.get(node, DEFAULT_PRIORITY), prompt_tokens)
+        self.stats.calls += 1
+        used = {"tokens": prompt_tokens}
+        start = time.monotonic()
+        try:
+            yield lambda tokens: used.update(tokens=tokens)
+        except Exception as e:
+            if is_rate_limited(e):
+                self._on_throttle(node)
+            raise
+        else:
+            self._on_success(node, time.monotonic() - start)
+        finally:
+            if self.tokens and used["tokens"] != prompt_tokens:
+                self.tokens.take(used["tokens"] - prompt_tokens)
+            self._release()
+
+    def metrics(self):
+        return {
+            "window": round(self.window, 2),
+            "active": self.active,
+            "queue_depth": len(self._queue),
+            "rpm": self.requests.capacity if self.requests else None,
+            "tpm": self.tokens.capacity if self.tokens else None,
+            **self.stats.as_dict(),
+        }
+
+
+class RateLimiter:
+    """One ProviderScheduler per provider, configured from the environment.
+
+    `RATE_LIMIT_<PROVIDER>_RPM`, `_TPM`, `_CONCURRENCY` and `_INITIAL` set
+    the limits for a provider name as returned by `provider_name`, upper-cased;
+    `RATE_LIMIT_RPM` etc. set the defaults for all providers.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._schedulers = {}
+        self._lock = threading.Lock()
+
+    def _setting(self, provider, name, default):
+        value = os.environ.get(f"RATE_LIMIT_{provider.upper()}_{name}", os.environ.get(f"RATE_LIMIT_{name}", default))
+        return int(value)
+
+    def for_model(self, model):
+        provider = provider_name(model)
+        with self._lock:
+            if provider not in self._schedulers:
+                self._schedulers[provider] = ProviderScheduler(
+                    provider,
+                    rpm=self._setting(provider, "RPM", 0),
+                    tpm=self._setting(provider, "TPM", 0),
+                    max_concurrency=self._setting(provider, "CONCURRENCY", 512),
+                    initial_concurrency=self._setting(provider, "INITIAL", 16),
+                )
+            return self._schedulers[provider]
+
+    async def invoke(self, model, messages, node, admitted=None, options=None):
+        """`model.ainvoke(messages)` under the provider's limits, retrying throttled and failed calls.
+
+        `admitted`, if given, is called each time the call leaves the queue.
+        `options`, if given, maps the model to extra invoke arguments.
+        """
+        kwargs = options(model) if options else {}
+        if not self.enabled:
+            call_admitted()
+            if admitted:
+                admitted()
+            response = await model.ainvoke(messages, **kwargs)
+            call_served(model_label(model), getattr(response, "usage_metadata", None))
+            return response
+        scheduler = self.for_model(model)
+        prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        for attempt in itertools.count():
+            try:
+                async with scheduler.slot(node, prompt_tokens) as report_usage:
+                    call_admitted()
+                    if admitted:
+                        admitted()
+                    response = await model.ainvoke(messages, **kwargs)
+                    usage = getattr(response, "usage_metadata", None)
+                    call_served(model_label(model), usage)
+                    if usage:
+                        report_usage(usage.get("total_tokens", prompt_tokens))
+                    return response
+            except Exception as e:
+                if not is_transient(e) or attempt >= RETRIES:
+                    raise
+                await asyncio.sleep(retry_after(e, attempt))
+
+    async def stream(self, model, messages, node, options=None):
+        """`model.astream(messages)` under the provider's limits; retried only before the first chunk."""
+        kwargs = options(model) if options else {}
+        if not self.enabled:
+            call_admitted()
+            usage = None
+            async for chunk in model.astream(messages, **kwargs):
+                call_first_token()
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+            call_served(model_label(model), usage)
+            return
+        scheduler = self.for_model(model)
+        prompt_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+        for attempt in itertools.count():
+            started = False
+            try:
+                async with scheduler.slot(node, prompt_tokens) as report_usage:
+                    call_admitted()
+                    usage = None
+                    async for chunk in model.astream(messages, **kwargs):
+                        started = True
+                        call_first_token()
+                        usage = getattr(chunk, "usage_metadata", None) or usage
+                        yield chunk
+                    call_served(model_label(model), usage)
+                    if usage:
+                        report_usage(usage.get("total_tokens", prompt_tokens))
+                    return
+            except Exception as e:
+                if started or not is_transient(e) or attempt >= RETRIES:
+                    raise
+                await asyncio.sleep(retry_after(e, attempt))
+
+    def metrics(self):
+        with self._lock:
+            schedulers = dict(self._schedulers)
+        return {provider: scheduler.metrics() for provider, scheduler in schedulers.items()}
+
+
+rate_limiter = RateLimiter(enabled=os.environ.get("RATE_LIMIT", "on").lower() not in ("off", "0", "false", "no"))
+# Retries left to the OpenAI client. With the scheduler on it makes none itself, so every 429
+# reaches the scheduler's backoff at once and attempts do not multiply with RATE_LIMIT_RETRIES
+CLIENT_MAX_RETRIES = 0 if rate_limiter.enabled else 2
@@ -0,0 +1,57 @@
+import threading
+from .utils import model_identity
+
+
+class PipelineRegistry:
+    """Precompiled LangGraph pipelines keyed by variant and model binding.
+
+    A compiled graph holds no per-run state, so one instance can serve any
+    number of concurrent invocations. Pipelines are built once (normally at
+    startup via `warm`) and looked up on every request afterwards.
+    """
+
+    def __init__(self, builders):
+        self._builders = dict(builders)
+        self._pipelines = {}
+        self._bound = {}
+        self._lock = threading.Lock()
+
+    def key(self, variant, *models):
+        if variant not in self._builders:
+            raise KeyError(f"Unknown pipeline variant: {variant}")
+        return (variant, tuple(model_identity(m) for m in models))
+
+    def get(self, variant, *models, checkpointer=None):
+        """The compiled pipeline; with a `checkpointer`, a copy of it that persists its runs there.
+
+        The copy shares the compiled graph and only swaps its checkpointer, so
+        a checkpointer reopened on another event loop replaces the previous
+        copy instead of compiling the pipeline again.
+        """
+        key = self.key(variant, *models)
+        app = self._pipelines.get(key)
+        if app is None:
+            with self._lock:
+                app = self._pipelines.get(key)
+                if app is None:
+                    app = self._pipelines[key] = self._builders[variant](*models)
+        if checkpointer is None:
+            return app
+        bound = self._bound.get(key)
+        if bound is None or bound.checkpointer is not checkpointer:
+            with self._lock:
+                bound = self._bound.get(key)
+                if bound is None or bound.checkpointer is not checkpointer:
+                    bound = self._bound[key] = app.copy(update={"checkpointer": checkpointer})
+        return bound
+
+    def warm(self, *models):
+        """Compile every registered variant for the given model binding."""
+        for variant in self._builders:
+            self.get(variant, *models)
+
+    def variants(self):
+        return list(self._builders)
+
+    def __len__(self):
+        return len(self._pipelines)
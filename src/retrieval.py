@@ -0,0 +1,121 @@
+import math
+import os
+import re
+from collections import Counter
+from .utils import estimate_tokens
+
+# Prompt budget for the source excerpt given to each paragraph_writer; 0 sends the full article
+PARAGRAPH_CONTEXT_TOKENS = int(os.environ.get("PARAGRAPH_CONTEXT_TOKENS", 3000))
+CHUNK_TOKENS = int(os.environ.get("RETRIEVAL_CHUNK_TOKENS", 200))
+
+_TERMS = re.compile(r"[a-z0-9]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;.])\s*")
+
+
+def tokenize(text):
+    """Latin words and numbers as-is, runs of CJK characters as overlapping bigrams."""
+    terms = []
+    for run in _TERMS.findall(text.lower()):
+        if run[0].isascii():
+            terms.append(run)
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def split_chunks(text, max_tokens=CHUNK_TOKENS):
+    """Split on paragraphs, then sentences, merging short pieces up to `max_tokens`."""
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n|\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(s for s in _SENTENCE_END.split(paragraph) if s.strip())
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of chunks, entirely in memory."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if chunks else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(chunks)
+        self.idf = {
+            term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def scores(self, query):
+        terms = set(tokenize(query))
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            for term in terms:
+                tf = counts.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+
+class ArticleContext:
+    """Per-run index over the source that hands each outline node only its relevant excerpt."""
+
+    # Chunks scoring below this fraction of the best match only share generic terms
+    MIN_RELATIVE_SCORE = 0.25
+
+    def __init__(self, article, budget_tokens=PARAGRAPH_CONTEXT_TOKENS):
+        self.article = article
+        self.budget_tokens = budget_tokens
+        self.fits = not budget_tokens or estimate_tokens(article) <= budget_tokens
+        self.index = None if self.fits else BM25Index(split_chunks(article))
+
+    def for_node(self, node):
+        """Best-matching chunks for the node's title and content, in source order, within budget."""
+        if self.fits:
+            return self.article
+        query = f"{node.get('title', '')} {node.get('content', '')}"
+        ranked = sorted(enumerate(self.index.scores(query)), key=lambda item: item[1], reverse=True)
+
+        threshold = ranked[0][1] * self.MIN_RELATIVE_SCORE if ranked else 0
+        selected, used = [], 0
+        for position, score in ranked:
+            if score <= 0 or score < threshold:
+                break
+            tokens = estimate_tokens(self.index.chunks[position])
+            if used + tokens > self.budget_tokens:
+                continue
+            selected.append(position)
+            used += tokens
+        if not selected:
+            # Nothing matched lexically; fall back to the opening of the source
+            for position, chunk in enumerate(self.index.chunks):
+                used += estimate_tokens(chunk)
+                if selected and used > self.budget_tokens:
+                    break
+                selected.append(position)
+        return "\n\n".join(self.index.chunks[position] for position in sorted(selected))
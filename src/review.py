@@ -0,0 +1,53 @@
+import re
+from collections import defaultdict
+
+_TEXT = re.compile(r"[\w\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def _ngrams(text, min_len, max_len):
+    grams = set()
+    for run in _TEXT.findall(text):
+        for n in range(min_len, min(max_len, len(run)) + 1):
+            for i in range(len(run) - n + 1):
+                grams.add(run[i:i + n])
+    return grams
+
+
+def find_repetitions(paragraphs, min_len=4, max_len=12, min_sections=2, limit=8):
+    """Phrases repeated across sections, found locally from character n-grams.
+
+    Returns {node_id: [(phrase, [other node_ids]), ...]} for every section that
+    shares a phrase with at least one other. Only the longest form of nested
+    phrases is kept, and at most `limit` phrases per section, longest first.
+    """
+    sections = defaultdict(set)
+    for paragraph in paragraphs:
+        for gram in _ngrams(paragraph["full_text"], min_len, max_len):
+            sections[gram].add(paragraph["node_id"])
+
+    repeated = {gram: ids for gram, ids in sections.items() if len(ids) >= min_sections}
+    # Drop a phrase when a repeated phrase one character longer covers the same sections
+    covered = set()
+    for longer, ids in repeated.items():
+        for shorter in (longer[1:], longer[:-1]):
+            if shorter in repeated and repeated[shorter] <= ids:
+                covered.add(shorter)
+    maximal = [gram for gram in repeated if gram not in covered]
+
+    hints = defaultdict(list)
+    for gram in sorted(maximal, key=len, reverse=True):
+        for node_id in repeated[gram]:
+            if len(hints[node_id]) < limit:
+                hints[node_id].append((gram, sorted(repeated[gram] - {node_id})))
+    return dict(hints)
+
+
+def format_hints(hints, titles):
+    """Render one section's repetition hints as prompt text."""
+    if not hints:
+        return "（未发现与其他小节重复的短语）"
+    lines = []
+    for phrase, others in hints:
+        where = "、".join(f"《{titles.get(node_id, node_id)}》" for node_id in others)
+        lines.append(f"- “{phrase}” 也出现在 {where}")
+    return "\n".join(lines)
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from .ratelimit import rate_limiter
+from .utils import model_identity
+
+logger = logging.getLogger("uvicorn")
+
+# Nodes whose calls get a hedged duplicate once they run past the endpoint's p95
+HEDGE_NODES = tuple(
+    node.strip() for node in os.environ.get("HEDGE_NODES", "paragraph_node,section_review_node").split(",") if node.strip()
+)
+# Latency samples an endpoint needs for a node before its percentiles are trusted
+MIN_SAMPLES = 20
+WINDOW = 200
+# Endpoints failing more often than this over their recent calls are tried last
+MAX_ERROR_RATE = 0.5
+
+
+def _percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(int(p * len(ordered)), len(ordered) - 1)]
+
+
+class EndpointStats:
+    """Rolling latency per node and outcomes for one endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.outcomes = deque(maxlen=WINDOW)
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, node, latency=None, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.outcomes.append(error)
+            if latency is not None:
+                self.latency.setdefault(node, deque(maxlen=WINDOW)).append(latency)
+
+    def percentile(self, node, p):
+        """Latency percentile for `node`, or None until MIN_SAMPLES calls have completed."""
+        with self._lock:
+            samples = list(self.latency.get(node, ()))
+        return _percentile(samples, p) if len(samples) >= MIN_SAMPLES else None
+
+    def error_rate(self):
+        with self._lock:
+            return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def as_dict(self):
+        with self._lock:
+            latency = {node: list(samples) for node, samples in self.latency.items()}
+            outcomes = list(self.outcomes)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(sum(outcomes) / len(outcomes), 4) if outcomes else 0.0,
+            "latency": {
+                node: {"p50": round(_percentile(s, 0.5), 3), "p95": round(_percentile(s, 0.95), 3), "samples": len(s)}
+                for node, s in latency.items()
+            },
+        }
+
+
+class ModelRouter:
+    """Several endpoints serving the same model, used as one model by the nodes.
+
+    Each call goes to the healthy endpoint with the lowest p50 for its node
+    (configuration order until there are enough samples). A call that fails
+    moves on to the next endpoint. For nodes in HEDGE_NODES, a call still
+    running after its endpoint's p95 gets a duplicate on the next endpoint,
+    and whichever answers first wins.
+    """
+
+    def __init__(self, endpoints, hedge_nodes=HEDGE_NODES):
+        self.endpoints = list(endpoints)
+        self.hedge_nodes = set(hedge_nodes)
+        self.model_name = "+".join(model_identity(endpoint) for endpoint in self.endpoints)
+        self.stats = {model_identity(endpoint): EndpointStats() for endpoint in self.endpoints}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def _stats(self, endpoint):
+        return self.stats[model_identity(endpoint)]
+
+    def ranked(self, node):
+        def score(item):
+            index, endpoint = item
+            stats = self._stats(endpoint)
+            p50 = stats.percentile(node, 0.5)
+            return (stats.error_rate() > MAX_ERROR_RATE, p50 if p50 is not None else float("inf"), index)
+
+        return [endpoint for _, endpoint in sorted(enumerate(self.endpoints), key=score)]
+
+    async def _attempt(self, endpoint, messages, node, admitted=None, options=None):
+        # Latency is measured from admission, so time queued behind rate limits does not count
+        start = [time.perf_counter()]
+
+        def on_admitted():
+            start[0] = time.perf_counter()
+            if admitted:
+                admitted.set()
+
+        try:
+            response = await rate_limiter.invoke(endpoint, messages, node, admitted=on_admitted, options=options)
+        except Exception:
+            self._stats(endpoint).record(node, error=True)
+            raise
+        self._stats(endpoint).record(node, latency=time.perf_counter() - start[0])
+        return response
+
+    @staticmethod
+    async def _hedge_timer(admitted, delay):
+        await admitted.wait()
+        await asyncio.sleep(delay)
+
+    async def ainvoke(self, messages, node=None, options=None):
+        candidates = self.ranked(node)
+        first = candidates.pop(0)
+        admitted = asyncio.Event()
+        tasks = {asyncio.ensure_future(self._attempt(first, messages, node, admitted, options)): first}
+        hedge_after = self._stats(first).percentile(node, 0.95) if node in self.hedge_nodes and candidates else None
+        timer = asyncio.ensure_future(self._hedge_timer(admitted, hedge_after)) if hedge_after is not None else None
+        hedge = None
+        error = None
+        try:
+            while tasks:
+                done, _ = await asyncio.wait([*tasks, *filter(None, [timer])], return_when=asyncio.FIRST_COMPLETED)
+                if timer in done:
+                    # The call is in its endpoint's slow tail: race a duplicate on the next endpoint
+                    done.discard(timer)
+                    timer = None
+                    if candidates:
+                        endpoint = candidates.pop(0)
+                        self.hedges += 1
+                        logger.info(f"hedging {node} on {model_identity(endpoint)}")
+                        hedge = asyncio.ensure_future(self._attempt(endpoint, messages, node, options=options))
+                        tasks[hedge] = endpoint
+                for task in done:
+                    endpoint = tasks.pop(task)
+                    if task.exception() is None:
+                        self.hedge_wins += task is hedge
+                        return task.result()
+                    error = task.exception()
+                    logger.warning(f"{node} failed on {model_identity(endpoint)}: {error}")
+                if not tasks and candidates:
+                    self.failovers += 1
+                    endpoint = candidates.pop(0)
+                    tasks[asyncio.ensure_future(self._attempt(endpoint, messages, node, options=options))] = endpoint
+            raise error
+        finally:
+            for task in [*tasks, *filter(None, [timer])]:
+                task.cancel()
+
+    async def astream(self, messages, node=None, options=None):
+        """Stream from the best endpoint, failing over only before the first chunk arrives."""
+        candidates = self.ranked(node)
+        for i, endpoint in enumerate(candidates):
+            started = False
+            start = time.perf_counter()
+            try:
+                async for chunk in rate_limiter.stream(endpoint, messages, node, options):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                self._stats(endpoint).record(node, error=True)
+                if started or i == len(candidates) - 1:
+                    raise
+                self.failovers += 1
+                logger.warning(f"{node} stream failed on {model_identity(endpoint)}: {e}")
+                continue
+            self._stats(endpoint).record(node, latency=time.perf_counter() - start)
+            return
+
+    def metrics(self):
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "endpoints": {identity: stats.as_dict() for identity, stats in self.stats.items()},
+        }
+
+
+_routers = []
+
+
+def routed(primary, alternatives):
+    """`primary` alone, or a ModelRouter over it and `alternatives` when there are any."""
+    if not alternatives or os.environ.get("ROUTING", "on").lower() in ("off", "0", "false", "no"):
+        return primary
+    router = ModelRouter([primary, *alternatives])
+    _routers.append(router)
+    return router
+
+
+async def invoke(model, messages, node, options=None):
+    if isinstance(model, ModelRouter):
+        return await model.ainvoke(messages, node, options)
+    return await rate_limiter.invoke(model, messages, node, options=options)
+
+
+async def stream(model, messages, node, options=None):
+    if isinstance(model, ModelRouter):
+        source = model.astream(messages, node, options)
+    else:
+        source = rate_limiter.stream(model, messages, node, options)
+    async for chunk in source:
+        yield chunk
+
+
+def routing_stats():
+    return {router.model_name: router.metrics() for router in _routers}
@@ -1,4 +1,4 @@
-from typing import TypedDict, Annotated, TypeVar
+from typing import TypedDict, Annotated, NotRequired, TypeVar
 import operator
 
 T = TypeVar('T')
@@ -6,17 +6,33 @@ T = TypeVar('T')
 def take_latest(old_value, new_value) -> T:
     return new_value
 
+def merge_paragraphs(old_value, new_value) -> list:
+    """Append new paragraphs; one with an existing node_id replaces it in place."""
+    merged = list(old_value)
+    positions = {p["node_id"]: i for i, p in enumerate(merged)}
+    for paragraph in new_value:
+        if paragraph["node_id"] in positions:
+            merged[positions[paragraph["node_id"]]] = paragraph
+        else:
+            positions[paragraph["node_id"]] = len(merged)
+            merged.append(paragraph)
+    return merged
+
 class State(TypedDict):
     original_article: Annotated[str, take_latest]
+    preprocessing: dict
     outline: Annotated[dict, take_latest]
     final_article: str
     insights: Annotated[str, operator.concat]
     transcript: Annotated[str, operator.concat]
     messages: Annotated[list, operator.add]
-    paragraphs: Annotated[list, operator.add]
+    paragraphs: Annotated[list, merge_paragraphs]
     metadata: dict
     preface: Annotated[str, operator.concat]
+    fact_check: str
+    web_context: dict
 
 class ParagraphState(TypedDict):
     original_article: str
-    node: dict
\ No newline at end of file
+    node: dict
+    web_context: NotRequired[str]
\ No newline at end of file
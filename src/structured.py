@@ -0,0 +1,216 @@
+import ast
+import json
+import logging
+import os
+import re
+import threading
+from functools import partial
+from langchain_core.messages import AIMessage, HumanMessage
+from .llm import call_model
+from .prompts import STRUCTURED_REPAIR_PROMPT
+from .ratelimit import provider_name
+from .utils import estimate_tokens
+
+logger = logging.getLogger("uvicorn")
+
+# Corrective calls a node may make after a reply that cannot be parsed or validated
+RETRIES = int(os.environ.get("STRUCTURED_RETRIES", 2))
+# Provider modes: "json_schema" constrains output to the schema, "json_object" to some JSON object.
+# STRUCTURED_OUTPUT=prompt turns both off and relies on the prompt and the local parser alone.
+PROVIDER_MODES = {"openai": "json_schema", "deepseek": "json_object", "openrouter": "json_object", "siliconflow": "json_object"}
+STRUCTURED_OUTPUT = os.environ.get("STRUCTURED_OUTPUT", "provider").lower()
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.S)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_TYPES = {"object": dict, "array": list, "string": str, "boolean": bool, "null": type(None)}
+
+
+class StructuredOutputError(ValueError):
+    """A reply that is not JSON, or does not match its schema, even after local repair."""
+
+
+def response_format(model, schema, name="output"):
+    """Extra invoke arguments asking `model`'s provider for JSON output, or {} if it has no such mode."""
+    mode = PROVIDER_MODES.get(provider_name(model)) if STRUCTURED_OUTPUT == "provider" else None
+    if mode == "json_schema":
+        return {"response_format": {"type": "json_schema", "json_schema": {"name": name, "schema": schema}}}
+    if mode == "json_object":
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+
+def _balanced(text):
+    """The first complete {...} or [...] in `text`, or its unterminated tail with the missing closers added."""
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    stack = []
+    in_string = escape = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+            if not stack:
+                return text[start:i + 1]
+    # Truncated output: close the open string and brackets
+    return text[start:] + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def parse_json(text):
+    """Parse model output that should be JSON, tolerating what models wrap around it.
+
+    Tries the text as is, then the contents of a code fence, then the first
+    balanced object or array with trailing commas dropped and a truncated
+    tail closed, then a Python literal (single quotes, True/None). Returns
+    (value, repaired), where `repaired` is True if any of that was needed.
+    """
+    try:
+        return json.loads(text), False
+    except (json.JSONDecodeError, TypeError):
+        pass
+    fenced = _FENCE.search(text)
+    candidates = [fenced.group(1)] if fenced else []
+    candidates.append(_balanced(fenced.group(1) if fenced else text))
+    for candidate in filter(None, candidates):
+        for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+            try:
+                return json.loads(attempt), True
+            except json.JSONDecodeError:
+                pass
+            try:
+                value = ast.literal_eval(attempt)
+            except (ValueError, SyntaxError, MemoryError, RecursionError):
+                continue
+            if isinstance(value, (dict, list)):
+                return value, True
+    raise StructuredOutputError(f"not valid JSON: {text[:200]}")
+
+
+def validate(value, schema, path="$"):
+    """Errors of `value` against the subset of JSON Schema used in `src/json_schema.py`."""
+    expected = schema.get("type")
+    if expected in ("number", "integer"):
+        if isinstance(value, bool) or not isinstance(value, int if expected == "integer" else (int, float)):
+            return [f"{path} should be {expected}"]
+    elif expected and not isinstance(value, _TYPES[expected]):
+        return [f"{path} should be {expected}"]
+    errors = []
+    if isinstance(value, dict):
+        errors += [f"{path} is missing {key}" for key in schema.get("required", []) if key not in value]
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors += validate(value[key], subschema, f"{path}.{key}")
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            errors += validate(item, schema["items"], f"{path}[{i}]")
+    return errors
+
+
+def parse_structured(text, schema):
+    """(value, repaired) for a reply that must match `schema`; raises StructuredOutputError otherwise.
+
+    A reply that wraps a valid value in a single-key object ({"outline": {...}})
+    is unwrapped.
+    """
+    value, repaired = parse_json(text)
+    errors = validate(value, schema)
+    if errors and isinstance(value, dict) and len(value) == 1:
+        inner = next(iter(value.values()))
+        if not validate(inner, schema):
+            return inner, True
+    if errors:
+        raise StructuredOutputError("; ".join(errors[:5]))
+    return value, repaired
+
+
+class StructuredStats:
+    """Per node: replies parsed as is, repaired locally, and failed, with the output tokens failures wasted."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nodes = {}
+
+    def record(self, node, outcome, text=""):
+        with self._lock:
+            counts = self._nodes.setdefault(
+                node, {"replies": 0, "clean": 0, "repaired": 0, "failed": 0, "retries": 0, "exhausted": 0, "wasted_tokens": 0}
+            )
+            counts["replies"] += outcome in ("clean", "repaired", "failed")
+            counts[outcome] += 1
+            if outcome == "failed":
+                counts["wasted_tokens"] += estimate_tokens(text)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                node: {
+                    **counts,
+                    "repair_rate": round(counts["repaired"] / counts["replies"], 4) if counts["replies"] else 0.0,
+                    "failure_rate": round(counts["failed"] / counts["replies"], 4) if counts["replies"] else 0.0,
+                }
+                for node, counts in self._nodes.items()
+            }
+
+
+structured_stats = StructuredStats()
+
+
+def accepts(schema):
+    """An `accept` check for `call_model`: True when a reply parses against `schema`."""
+    def accept(text):
+        try:
+            parse_structured(text, schema)
+        except StructuredOutputError:
+            return False
+        return True
+    return accept
+
+
+async def ensure_structured(model, messages, text, node, schema, retries=RETRIES):
+    """Parse `text`, the reply to `messages`, against `schema`, asking the model to correct it if needed.
+
+    Each corrective call shows the model its previous reply and what was wrong
+    with it. Only this node's call is repeated, at most `retries` times; the
+    last StructuredOutputError is raised when the budget is spent.
+    """
+    options = partial(response_format, schema=schema)
+    for attempt in range(retries + 1):
+        try:
+            value, repaired = parse_structured(text, schema)
+        except StructuredOutputError as e:
+            structured_stats.record(node, "failed", text)
+            if attempt == retries:
+                structured_stats.record(node, "exhausted")
+                raise StructuredOutputError(f"{node}: {e}") from e
+            logger.warning(f"{node} reply rejected ({e}), asking for a correction")
+            structured_stats.record(node, "retries")
+            messages = [*messages, AIMessage(content=text), HumanMessage(content=STRUCTURED_REPAIR_PROMPT.format(error=e))]
+            response = await call_model(model, messages, node=node, template="STRUCTURED_REPAIR_PROMPT",
+                                        options=options, accept=accepts(schema))
+            text = response.content
+            continue
+        structured_stats.record(node, "repaired" if repaired else "clean")
+        return value
+
+
+async def call_structured(model, messages, node, schema, template=None, retries=RETRIES):
+    """`call_model` for a reply that must be JSON matching `schema`; returns the parsed value.
+
+    The provider's JSON mode is requested where `PROVIDER_MODES` lists one.
+    Replies that fail to parse are not cached.
+    """
+    response = await call_model(model, messages, node=node, template=template,
+                                options=partial(response_format, schema=schema), accept=accepts(schema))
+    return await ensure_structured(model, messages, response.content, node, schema, retries)
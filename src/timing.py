@@ -0,0 +1,254 @@
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from .metrics import estimate_cost, observe_call, observe_node
+
+_current_timer = ContextVar("run_timer", default=None)
+_current_call = ContextVar("llm_call", default=None)
+
+
+class RunTimer:
+    """Collects (node, start, end) spans and LLM calls for one workflow run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.calls = []
+
+    def record(self, node, start, end):
+        self.spans.append((node, start - self.started, end - self.started))
+
+    def __enter__(self):
+        self._token = _current_timer.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current_timer.reset(self._token)
+
+    def node_windows(self):
+        """First start and last end per node; fan-out nodes collapse into one window."""
+        windows = {}
+        for node, start, end in self.spans:
+            first, last = windows.get(node, (start, end))
+            windows[node] = (min(first, start), max(last, end))
+        return windows
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+class LLMCall:
+    """Timings and token usage of one LLM call made by a node.
+
+    `queue_wait` runs from the call to its first admission by the provider's
+    scheduler, `duration` from admission to the response and `ttft` from
+    admission to the first streamed chunk. Only streamed calls have a
+    `ttft`; a call answered in one piece reports no first token. Tokens come from the provider's usage report, or are estimated
+    from the text when there is none.
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.model = None
+        self.started = time.perf_counter()
+        self.admitted = None
+        self.first_token = None
+        self.ended = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached = False
+        self.error = None
+        self.cost = None
+
+    @property
+    def queue_wait(self):
+        return self.admitted - self.started if self.admitted is not None else None
+
+    @property
+    def duration(self):
+        return self.ended - (self.admitted or self.started)
+
+    @property
+    def ttft(self):
+        return self.first_token - (self.admitted or self.started) if self.first_token is not None else None
+
+    def as_dict(self, origin=0.0):
+        def rounded(value):
+            return round(value, 3) if value is not None else None
+
+        return {
+            "node": self.node,
+            "model": self.model,
+            "start": rounded(self.started - origin),
+            "queue_wait": rounded(self.queue_wait),
+            **({"ttft": rounded(self.ttft)} if self.ttft is not None else {}),
+            "duration": rounded(self.duration),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": round(self.cost, 6) if self.cost is not None else None,
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+
+@contextmanager
+def llm_call(node):
+    """Record the LLM call made in this scope on the active RunTimer and in /metrics."""
+    call = LLMCall(node)
+    token = _current_call.set(call)
+    try:
+        yield call
+    except BaseException as e:
+        call.error = type(e).__name__
+        raise
+    finally:
+        _current_call.reset(token)
+        call.ended = time.perf_counter()
+        if not call.cached and not call.error:
+            call.cost = estimate_cost(call.model, call.prompt_tokens, call.completion_tokens)
+        timer = current_timer()
+        if timer:
+            timer.calls.append(call)
+        observe_call(call)
+
+
+def call_admitted():
+    """Called by the scheduler when the current LLM call leaves its queue; the first admission counts."""
+    call = _current_call.get()
+    if call and call.admitted is None:
+        call.admitted = time.perf_counter()
+
+
+def call_first_token():
+    call = _current_call.get()
+    if call and call.first_token is None:
+        call.first_token = time.perf_counter()
+
+
+def call_served(model, usage=None):
+    """Called with the label of the endpoint that answered the current call and its usage report."""
+    call = _current_call.get()
+    if call:
+        call.model = model
+        if usage:
+            call.prompt_tokens = usage.get("input_tokens", 0)
+            call.completion_tokens = usage.get("output_tokens", 0)
+
+
+def timed(name, func):
+    """Wrap a node so each call is recorded on the active RunTimer, if any."""
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(state):
+            start = time.perf_counter()
+            try:
+                return await func(state)
+            finally:
+                _record(name, start)
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return func(state)
+        finally:
+            _record(name, start)
+    return wrapper
+
+
+def _record(name, start):
+    end = time.perf_counter()
+    observe_node(name, end - start)
+    timer = current_timer()
+    if timer:
+        timer.record(name, start, end)
+
+
+def estimate_wall_time(durations, deps):
+    """Replay per-node durations through `deps` the way LangGraph executes them.
+
+    LangGraph runs in supersteps: a node becomes ready one step after its last
+    dependency, and a step lasts as long as its slowest node.
+    """
+    levels = {}
+
+    def level(node):
+        if node not in levels:
+            parents = [p for p in deps.get(node, []) if p in durations]
+            levels[node] = max((level(p) for p in parents), default=-1) + 1
+        return levels[node]
+
+    steps = {}
+    for node, duration in durations.items():
+        step = level(node)
+        steps[step] = max(steps.get(step, 0.0), duration)
+    return sum(steps.values())
+
+
+def llm_usage(calls, by_node=True):
+    """Call counts, queue wait, tokens and cost of `calls`, per node or in total."""
+    usage = {}
+    for call in calls:
+        entry = usage.setdefault(call.node if by_node else None, {
+            "calls": 0, "cached": 0, "errors": 0, "queue_wait": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+        })
+        entry["calls"] += 1
+        entry["cached"] += call.cached
+        entry["errors"] += call.error is not None
+        entry["queue_wait"] = round(entry["queue_wait"] + (call.queue_wait or 0.0), 3)
+        entry["prompt_tokens"] += call.prompt_tokens
+        entry["completion_tokens"] += call.completion_tokens
+        entry["cost"] = round(entry["cost"] + (call.cost or 0.0), 6)
+    return usage if by_node else usage.get(None, {})
+
+
+def critical_path_report(timer, deps, baseline_deps=None):
+    """Summarize where a run spent its wall-clock time.
+
+    The critical path walks back from the last node to finish, always through
+    the dependency that finished latest. Nodes that ran more than once (the
+    paragraph fan-out) also report their count and slowest run, and every
+    node reports the LLM calls it made. When `baseline_deps` is given, the
+    same node durations are replayed through both topologies to show what the
+    run would have cost with the baseline wiring.
+    """
+    windows = timer.node_windows()
+    if not windows:
+        return {}
+    durations = {node: end - start for node, (start, end) in windows.items()}
+
+    path = []
+    node = max(windows, key=lambda n: windows[n][1])
+    while node:
+        path.append(node)
+        parents = [p for p in deps.get(node, []) if p in windows]
+        node = max(parents, key=lambda p: windows[p][1]) if parents else None
+    path.reverse()
+
+    nodes = {}
+    for node, (start, end) in sorted(windows.items(), key=lambda item: item[1][0]):
+        nodes[node] = {"start": round(start, 3), "end": round(end, 3), "duration": round(end - start, 3)}
+        runs = [span_end - span_start for name, span_start, span_end in timer.spans if name == node]
+        if len(runs) > 1:
+            nodes[node].update(count=len(runs), slowest=round(max(runs), 3))
+    for node, usage in llm_usage(timer.calls).items():
+        nodes.setdefault(node, {})["llm"] = usage
+
+    report = {
+        "wall_time": round(max(end for _, end in windows.values()), 3),
+        "critical_path": path,
+        "nodes": nodes,
+        "llm": llm_usage(timer.calls, by_node=False),
+    }
+    if baseline_deps is not None:
+        estimate = estimate_wall_time(durations, deps)
+        baseline = estimate_wall_time(durations, baseline_deps)
+        report["estimated_wall_time"] = round(estimate, 3)
+        report["baseline_wall_time"] = round(baseline, 3)
+        report["saving"] = round(baseline - estimate, 3)
+    return report
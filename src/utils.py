@@ -1,3 +1,6 @@
+import json
+import re
+
 def remove_json_markers(text):
     # Define the markers
     start_marker = "```json"
@@ -12,4 +15,81 @@ def remove_json_markers(text):
         text = text[:-len(end_marker)]
 
     # Strip any extra whitespace that might remain
-    return text.strip()
\ No newline at end of file
+    return text.strip()
+
+_CJK = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+
+def estimate_tokens(text):
+    """Rough token count: one per CJK character, one per four other characters."""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def model_identity(model):
+    """Stable identity for a chat model: class, model name and endpoint."""
+    name = getattr(model, "model_name", None) or getattr(model, "model", None)
+    base_url = getattr(model, "openai_api_base", None) or "default"
+    return f"{type(model).__name__}:{name}@{base_url}"
+
+
+
+class ChildrenStreamParser:
+    """Incrementally extracts complete items of an outline's "children" array.
+
+    Feed it streamed model output; each call returns the child objects that
+    became complete with that chunk, so work on a section can start before the
+    rest of the outline has been generated.
+    """
+
+    _CHILDREN_KEY = re.compile(r'(?<!\\)"children"\s*:\s*\[')
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None  # scan position inside the children array
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+        self.done = False
+
+    def feed(self, text):
+        self.buffer += text
+        if self.done:
+            return []
+        if self.pos is None:
+            match = self._CHILDREN_KEY.search(self.buffer)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        items = []
+        buffer = self.buffer
+        for i in range(self.pos, len(buffer)):
+            char = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0 and char == "{":
+                    self.item_start = i
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0:
+                    self.done = True
+                    break
+                self.depth -= 1
+                if self.depth == 0 and self.item_start is not None:
+                    try:
+                        items.append(json.loads(buffer[self.item_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+        self.pos = len(buffer)
+        return items
@@ -1,33 +1,170 @@
-from typing import List
-from langchain_community.tools import DuckDuckGoSearchRun
+import asyncio
+import json
+import logging
+import os
+import threading
+import weakref
+from .cache import cache_from_env, normalize_source
+from .singleflight import SingleFlight
 
-def search_web(query: str, max_results: int = 3) -> List[dict]:
-    """Search the web using DuckDuckGo and return relevant results."""
+logger = logging.getLogger("uvicorn")
+
+# "duckduckgo", "stub" (canned local results, no network) or "off"
+BACKEND = os.environ.get("WEB_SEARCH_BACKEND", "duckduckgo").lower()
+# Seconds one search may take before the section goes without web context
+TIMEOUT = float(os.environ.get("WEB_SEARCH_TIMEOUT", 5))
+# Searches in flight per process
+CONCURRENCY = int(os.environ.get("WEB_SEARCH_CONCURRENCY", 4))
+# Characters of search results given to one paragraph
+MAX_CHARS = int(os.environ.get("WEB_SEARCH_MAX_CHARS", 2000))
+
+# Results keyed by normalized query (WEB_SEARCH_CACHE=memory|sqlite|off)
+search_cache = cache_from_env("WEB_SEARCH_CACHE", default_size=1024, default_ttl=3600, table="web_search")
+
+
+class DuckDuckGoBackend:
+    """DuckDuckGo through langchain_community, with one client reused for every search."""
+
+    name = "duckduckgo"
+
+    def __init__(self):
+        from langchain_community.tools import DuckDuckGoSearchRun
+        self._search = DuckDuckGoSearchRun()
+
+    def search(self, query):
+        return self._search.invoke(query)
+
+
+class StubBackend:
+    """Canned results for tests and offline runs.
+
+    Answers from the JSON object of query to result at WEB_SEARCH_STUB_PATH,
+    if set, and otherwise with a fixed text naming the query.
+    """
+
+    name = "stub"
+
+    def __init__(self, path=None):
+        self.results = {}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                self.results = {normalize_query(query): text for query, text in json.load(f).items()}
+
+    def search(self, query):
+        return self.results.get(normalize_query(query), f"Background on {query}.")
+
+
+def normalize_query(query):
+    return normalize_source(query).lower()
+
+
+class WebSearchStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"searches": 0, "cache_hits": 0, "empty": 0, "timeouts": 0, "errors": 0}
+
+    def record(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {"backend": BACKEND, **self.counts, "cache": search_cache.stats() if search_cache else None}
+
+
+web_search_stats = WebSearchStats()
+
+_backend = None
+_backend_lock = threading.Lock()
+# Semaphore and single-flight group per event loop; asyncio primitives belong to the loop that first uses them
+_loop_state = weakref.WeakKeyDictionary()
+
+
+def backend():
+    """The configured backend, built on first use; None when web search is off."""
+    global _backend
+    if BACKEND in ("off", "none", "0", ""):
+        return None
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND == "duckduckgo":
+                _backend = DuckDuckGoBackend()
+            elif BACKEND == "stub":
+                _backend = StubBackend(os.environ.get("WEB_SEARCH_STUB_PATH"))
+            else:
+                raise ValueError(f"Unknown WEB_SEARCH_BACKEND: {BACKEND}")
+        return _backend
+
+
+def _for_loop():
+    """(semaphore, single-flight group) of the running event loop."""
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is None:
+        state = _loop_state[loop] = (asyncio.Semaphore(CONCURRENCY), SingleFlight())
+    return state
+
+
+async def _run_search(query):
+    semaphore, _ = _for_loop()
     try:
-        query = query.strip()
-        if not query:
-            print("Error: Empty search query")
-            return []
-        
-        keywords = query
-        keywords = "a16z"
-        print(f"Searching for: {keywords}")
-            
-        search = DuckDuckGoSearchRun()
-        result = search.invoke(keywords)
-        print(f"Raw search result: {result}")
-        
-        if not result:
-            print(f"No search results found for keywords: {keywords}")
-            return ""
-            
-        return result
+        async with semaphore:
+            web_search_stats.record("searches")
+            # Backends are blocking clients; a timed-out search keeps its thread but not the caller
+            result = await asyncio.wait_for(asyncio.to_thread(backend().search, query), TIMEOUT)
+    except asyncio.TimeoutError:
+        web_search_stats.record("timeouts")
+        logger.warning(f"web search timed out after {TIMEOUT}s: {query}")
+        return ""
+    except Exception as e:
+        web_search_stats.record("errors")
+        logger.warning(f"web search failed for {query}: {e}")
+        return ""
+    result = (result or "").strip()
+    if not result:
+        web_search_stats.record("empty")
+    elif search_cache is not None:
+        search_cache.set(normalize_query(query), result)
+    return result
+
 
+async def search(query):
+    """Search results for `query` as text; "" when search is off, fails or times out.
+
+    Results are cached by normalized query, and concurrent searches for the
+    same query share one request. Failures are not cached.
+    """
+    query = " ".join(query.split())
+    if not query:
+        return ""
+    try:
+        if backend() is None:
+            return ""
     except Exception as e:
-        print(f"Error during web search: {e}")
+        # A backend that cannot be built (its client not installed, say) fails every search the same way
+        web_search_stats.record("errors")
+        logger.warning(f"web search unavailable: {e}")
         return ""
+    key = normalize_query(query)
+    if search_cache is not None:
+        cached = search_cache.get(key)
+        if cached is not None:
+            web_search_stats.record("cache_hits")
+            return cached
+    _, inflight = _for_loop()
+    return await inflight.do(key, lambda: _run_search(query))
+
+
+def section_query(outline, section):
+    """The search query for one outline section: the article title narrowed by the section title."""
+    return f"{outline.get('title', '')} {section.get('title', '')}".strip()
+
 
-def enrich_content(topic: str) -> str:
-    """Search and compile relevant background information for a topic."""
-    search_results = search_web(topic)
-    return search_results
\ No newline at end of file
+async def enrich_sections(outline):
+    """Web context per outline section, keyed by node_id; sections without results are left out."""
+    sections = outline.get("children", [])
+    results = await asyncio.gather(*(search(section_query(outline, section)) for section in sections))
+    return {
+        section["node_id"]: result[:MAX_CHARS]
+        for section, result in zip(sections, results) if result
+    }